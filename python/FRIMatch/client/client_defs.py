@@ -42,6 +42,7 @@ MODE: 'MODE'
 NUDGE_INC = 'NUDGE_INC'
 TRACK_INC = 'TRACK_INC'
 TRACK_DELAY = 'TRACK_DELAY'
+TRACK_RATE = 'TRACK_RATE'
 SCAN_INC = 'SCAN_INC'
 SCAN_DELAY = 'SCAN_DELAY'
 # Relay section
@@ -53,6 +54,7 @@ HIGH_RANGE = 'HIGH-RANGE'
 FREQ = 'FREQ'
 LABEL = 'LABEL'
 ENERGISE = 'ENERGISE'
+BANDS = 'BANDS'
 # State section
 MAIN_WIN = 'MAIN_WIN'
 CONFIG_WIN = 'CONFIG_WIN'
@@ -63,14 +65,17 @@ MODE_SCAN = 'MODE_SCAN'
 DEFAULT_NUDGE_INC = 2
 DEFAULT_TRACK_INC = 1
 DEFAULT_TRACK_DELAY = 20    # ms
+DEFAULT_TRACK_RATE = 20     # moves per second per capacitor
 DEFAULT_SCAN_INC = 1
 DEFAULT_SCAN_DELAY = 20     # ms
 
 #=======================================================================
 # UI
 CONFIG_PATH = '../config/auto_tuner.cfg'
-IDLE_TICKER = 100
-HEARTBEAT_TIMER = 10 # 10 * IDLE_TICKER = 1s ; heartbeats should be every 0.5s
+HEARTBEAT_CHECK = 1000 # ms ; heartbeats should be every 0.5s
+SUBSCRIBE_PERIOD = 10000 # ms, well inside the server SUBSCRIBE_TIMEOUT
+PING_PERIOD = 2000 # ms between latency probes
+HOME_DELAY = 2.0 # s between homing the servos of a server that runs each separately
 
 # To populate relay dropdowns
 g_pins = ['4','17','18','27','22','23','24','25','6','12','13','16','19','20','21']
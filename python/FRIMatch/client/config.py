@@ -53,9 +53,9 @@ class Config(QMainWindow):
         
         # Initialise the GUI
         self.initUI()
-    
-        # Start idle processing
-        QtCore.QTimer.singleShot(IDLE_TICKER, self.__idleProcessing)
+        
+        # Tests need the tuner
+        self.__show_tuner_status()
         
     #========================================================================================    
     # UI initialisation and window event handlers
@@ -257,6 +257,7 @@ class Config(QMainWindow):
     def __set_params(self, g):
         # Set the following
         # NUDGE_INC
+        # TRACK_RATE
         # TRACK_INC
         # TRACK_DELAY
         # SCAN_INC
@@ -264,11 +265,13 @@ class Config(QMainWindow):
 
         # Labels
         nudge_inc_lbl = QLabel("Nudge inc")
+        track_rate_lbl = QLabel("Track rate")
         track_inc_lbl = QLabel("Track inc")
         track_delay_lbl = QLabel("Track delay")
         scan_inc_lbl = QLabel("Scan inc")
         scan_delay_lbl = QLabel("Scan delay")
         g.addWidget(nudge_inc_lbl, 0,0)
+        g.addWidget(track_rate_lbl, 0,2)
         g.addWidget(track_inc_lbl, 1,0)
         g.addWidget(track_delay_lbl, 1,2)
         g.addWidget(scan_inc_lbl, 2,0)
@@ -279,6 +282,10 @@ class Config(QMainWindow):
         self.__sb_nudge_inc.setRange(1, 10)
         self.__sb_nudge_inc.setToolTip('Degrees increment for nudge buttons')
         
+        self.__sb_track_rate = QSpinBox()
+        self.__sb_track_rate.setRange(1, 50)
+        self.__sb_track_rate.setToolTip('Most moves sent per second for each capacitor while tracking')
+        
         self.__sb_track_inc = QSpinBox()
         self.__sb_track_inc.setRange(1, 5)
         self.__sb_track_inc.setToolTip('Degrees increment while tracking')
@@ -296,6 +303,7 @@ class Config(QMainWindow):
         self.__sb_scan_delay.setToolTip('Wait time between wait increments in ms')
         
         g.addWidget(self.__sb_nudge_inc, 0,1)
+        g.addWidget(self.__sb_track_rate, 0,3)
         g.addWidget(self.__sb_track_inc, 1,1)
         g.addWidget(self.__sb_track_delay, 1,3)
         g.addWidget(self.__sb_scan_inc, 2,1)
@@ -324,6 +332,7 @@ class Config(QMainWindow):
         self.__cb_inv.setChecked(self.__model[CONFIG][RELAY][RELAY_INVERSE])
         
         self.__sb_nudge_inc.setValue(self.__model[CONFIG][SERVO][NUDGE_INC])
+        self.__sb_track_rate.setValue(self.__model[CONFIG][SERVO][TRACK_RATE])
         self.__sb_track_inc.setValue(self.__model[CONFIG][SERVO][TRACK_INC])
         self.__sb_track_delay.setValue(self.__model[CONFIG][SERVO][TRACK_DELAY])
         self.__sb_scan_inc.setValue(self.__model[CONFIG][SERVO][SCAN_INC])
@@ -345,7 +354,9 @@ class Config(QMainWindow):
         self.repaint()
     
     def tuner_status(self, status):
-        self.__tuner_status = status
+        if status != self.__tuner_status:
+            self.__tuner_status = status
+            self.__show_tuner_status()
         
     #========================================================================================
     # Event procs
@@ -377,19 +388,10 @@ class Config(QMainWindow):
         self.hide()
         
     #======================================================= 
-    def __idleProcessing   (self):
-        # Update UI with actual progress
-        if self.__tuner_status:
-            self.__btn_tx_tst_pwm.setEnabled(True)
-            self.__btn_ant_tst_pwm.setEnabled(True)
-            self.__btn_ind_test.setEnabled(True)
-        else:
-            self.__btn_tx_tst_pwm.setEnabled(False)
-            self.__btn_ant_tst_pwm.setEnabled(False)
-            self.__btn_ind_test.setEnabled(False)
-            
-        # Set timer
-        QtCore.QTimer.singleShot(IDLE_TICKER, self.__idleProcessing)
+    def __show_tuner_status(self):
+        self.__btn_tx_tst_pwm.setEnabled(self.__tuner_status)
+        self.__btn_ant_tst_pwm.setEnabled(self.__tuner_status)
+        self.__btn_ind_test.setEnabled(self.__tuner_status)
         
     def __ip_changed(self):
         self.__model[CONFIG][RPi][IP] = self.__iptxt.text()
@@ -442,14 +444,14 @@ class Config(QMainWindow):
         
         # Write new values to config
         self.__model[CONFIG][SERVO][NUDGE_INC] = self.__sb_nudge_inc.value()
+        self.__model[CONFIG][SERVO][TRACK_RATE] = self.__sb_track_rate.value()
         self.__model[CONFIG][SERVO][TRACK_INC] = self.__sb_track_inc.value()
         self.__model[CONFIG][SERVO][TRACK_DELAY] = self.__sb_track_delay.value()
         self.__model[CONFIG][SERVO][SCAN_INC] = self.__sb_scan_inc.value()
         self.__model[CONFIG][SERVO][SCAN_DELAY] = self.__sb_scan_delay.value()
         
-        # Set values
+        # Set values, nudge and track rate are local to the client
         params = (
-            self.__model[CONFIG][SERVO][NUDGE_INC],
             self.__model[CONFIG][SERVO][TRACK_INC],
             self.__model[CONFIG][SERVO][TRACK_DELAY],
             self.__model[CONFIG][SERVO][SCAN_INC],
@@ -36,14 +36,20 @@ import copy
 from PyQt5.QtWidgets import QMainWindow, QApplication, QToolTip
 from PyQt5.QtGui import QPainter, QPainterPath, QColor, QPen, QFont
 from PyQt5 import QtCore, QtGui
-from PyQt5.QtWidgets import QStatusBar, QTableWidget, QInputDialog, QFrame, QGroupBox, QMessageBox, QLabel, QSlider, QLineEdit, QTextEdit, QComboBox, QPushButton, QCheckBox, QRadioButton, QSpinBox, QAction, QWidget, QGridLayout, QTableWidgetItem
+from PyQt5.QtWidgets import QStatusBar, QTableView, QAbstractItemView, QInputDialog, QFrame, QGroupBox, QMessageBox, QLabel, QSlider, QLineEdit, QTextEdit, QComboBox, QPushButton, QCheckBox, QRadioButton, QSpinBox, QAction, QWidget, QGridLayout
 
 # Application imports
 from client_defs import *
 sys.path.append('../server')
 from server_defs import *
+import protocol
+import reliable
+import ping
+import bands
 import model
 import persist
+import memtable
+import throttle
 import config
 import memories
 
@@ -28,7 +28,7 @@ from imports import *
 # Memories window
 class Memories(QMainWindow):
     
-    def __init__(self, model, settings, callback):
+    def __init__(self, model, settings, callback, saved = None):
         
         super(Memories, self).__init__()
         
@@ -36,6 +36,8 @@ class Memories(QMainWindow):
         self.__model = model
         # Callback here to run memory
         self.__callback = callback
+        # Callback here when the memories have been saved
+        self.__saved = saved
         # Call here to get current settings
         self.__settings = settings
         
@@ -57,11 +59,9 @@ class Memories(QMainWindow):
         
         # Initialise the GUI
         self.initUI()
-        # Init table
-        self.__restore_from_model()
         
-        # Start idle processing
-        QtCore.QTimer.singleShot(IDLE_TICKER, self.__idleProcessing)
+        # Add and update need a name and frequency
+        self.__details_changed()
         
     #========================================================================================    
     # UI initialisation and window event handlers
@@ -83,12 +83,14 @@ class Memories(QMainWindow):
         self.__grid = QGridLayout()
         w.setLayout(self.__grid)
         
-        # Table area
-        self.__table = QTableWidget()
-        self.__table.setColumnCount(5)
-        self.__table.setHorizontalHeaderLabels(('Name','Freq','Inductor','TX Cap','Ant Cap'))
+        # Table area, a view on the memories in the model
+        self.__memories = memtable.MemoryTable(self.__model[MEMORIES])
+        self.__table = QTableView()
+        self.__table.setModel(self.__memories)
+        self.__table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.__table.setSelectionMode(QAbstractItemView.SingleSelection)
         self.__grid.addWidget(self.__table,0,0)
-        self.__table.currentItemChanged.connect(self.__row_click)
+        self.__table.selectionModel().currentRowChanged.connect(self.__row_click)
         self.__table.doubleClicked.connect(self.__row_double_click)
     
         # Control area
@@ -132,6 +134,8 @@ class Memories(QMainWindow):
         self.__freqtxt = QLineEdit()
         self.__freqtxt.setMaximumWidth(50)
         self.__detgrid.addWidget(self.__freqtxt, 0,3)
+        self.__nametxt.textChanged.connect(self.__details_changed)
+        self.__freqtxt.textChanged.connect(self.__details_changed)
         
         self.__add = QPushButton("Add")
         self.__add.setToolTip('Add new memory')
@@ -188,67 +192,51 @@ class Memories(QMainWindow):
     #========================================================================================
     # EVENT procs
     
-    def __idleProcessing(self):
-        QtCore.QTimer.singleShot(IDLE_TICKER, self.__idleProcessing)
-        
-        if len(self.__nametxt.text()) > 0 and len(self.__freqtxt.text()) > 0:
-            self.__nametxt.setEnabled(True)
-            self.__freqtxt.setEnabled(True)
+    def __details_changed(self):
+        ready = len(self.__nametxt.text()) > 0 and len(self.__freqtxt.text()) > 0
+        self.__add.setEnabled(ready)
+        self.__update.setEnabled(ready)
             
     def __do_add_mem(self):
         # Get data
         name = self.__nametxt.text()
         freq = self.__freqtxt.text()
-        low,high,tx,ant = self.__settings()
-        if low: ind = 'low-range'
-        else: ind = 'high-range'
-        # Create new row
-        rowPosition = self.__table.rowCount()
-        self.__table.insertRow(rowPosition)
-        self.__table.setItem(rowPosition, 0, QTableWidgetItem(name))
-        self.__table.setItem(rowPosition, 1, QTableWidgetItem(freq))
-        self.__table.setItem(rowPosition, 2, QTableWidgetItem(ind))
-        self.__table.setItem(rowPosition, 3, QTableWidgetItem(str(tx)))
-        self.__table.setItem(rowPosition, 4, QTableWidgetItem(str(ant)))
-        # Add to model
-        self.__update_model()
+        ind,tx,ant = self.__settings()
+        # Append to model and table
+        r = self.__memories.add(memtable.memory(name, freq, ind, tx, ant))
+        self.__table.selectRow(r)
     
     def __do_update_mem(self):
+        r = self.__current_row()
+        if r == -1:
+            return
         # Get data
         name = self.__nametxt.text()
         freq = self.__freqtxt.text()
-        low,high,tx,ant = self.__settings()
-        if low: ind = 'low-range'
-        else: ind = 'high-range'
-        # Update row
-        rowPosition = self.__table.currentRow()
-        self.__table.setItem(rowPosition, 0, QTableWidgetItem(name))
-        self.__table.setItem(rowPosition, 1, QTableWidgetItem(freq))
-        self.__table.setItem(rowPosition, 2, QTableWidgetItem(ind))
-        self.__table.setItem(rowPosition, 3, QTableWidgetItem(str(tx)))
-        self.__table.setItem(rowPosition, 4, QTableWidgetItem(str(ant)))
-        # Update model
-        self.__update_model()
+        ind,tx,ant = self.__settings()
+        # Update model and row
+        self.__memories.update(r, memtable.memory(name, freq, ind, tx, ant))
         
     def __do_run_mem(self):
-        r = self.__table.currentRow()
-        ind = self.__table.item(r, 2).text()
-        tx = self.__table.item(r, 3).text()
-        ant = self.__table.item(r, 4).text()
+        r = self.__current_row()
+        if r == -1:
+            return
+        name, freq, ind, tx, ant = self.__memories.memory(r)
         # Execute tuner commands
-        self.__callback(ind, tx, ant)
+        self.__callback(freq, ind, tx, ant)
             
     def __do_remove_mem(self):
-        r = self.__table.currentRow()
-        self.__table.removeRow(r)
-        # Remove from model
-        self.__update_model()
+        r = self.__current_row()
+        if r == -1:
+            return
+        # Remove from model and table
+        self.__memories.remove(r)
     
-    def __row_click(self):
-        r = self.__table.currentRow()
-        if r != -1:
-            self.__nametxt.setText(self.__table.item(r, 0).text())
-            self.__freqtxt.setText(self.__table.item(r, 1).text())
+    def __row_click(self, current, previous):
+        if current.isValid():
+            name, freq, ind, tx, ant = self.__memories.memory(current.row())
+            self.__nametxt.setText(name)
+            self.__freqtxt.setText(freq)
         
     def __row_double_click(self):
         self.__do_run_mem
@@ -256,6 +244,8 @@ class Memories(QMainWindow):
     def __do_save(self):
         # Save model
         persist.saveCfg(CONFIG_PATH, self.__model)
+        if self.__saved != None:
+            self.__saved()
         # and hide window
         self.hide()
         
@@ -268,30 +258,7 @@ class Memories(QMainWindow):
     #========================================================================================
     # PRIVATE procs
     
-    def __restore_from_model(self):
-        # Populate table from model
-        table_data = self.__model[MEMORIES]
-        for item in table_data:
-            rowPosition = self.__table.rowCount()
-            self.__table.insertRow(rowPosition)
-            self.__table.setItem(rowPosition, 0, QTableWidgetItem(item[0]))
-            self.__table.setItem(rowPosition, 1, QTableWidgetItem(item[1]))
-            self.__table.setItem(rowPosition, 2, QTableWidgetItem(item[2]))
-            self.__table.setItem(rowPosition, 3, QTableWidgetItem(item[3]))
-            self.__table.setItem(rowPosition, 4, QTableWidgetItem(item[4]))
-        
-    def __update_model(self):
-        # Clear and re-populate from table
-        self.__model[MEMORIES].clear()
-        entry = []
-        rowCount = self.__table.rowCount()
-        for row in range(rowCount):
-            entry = [
-                self.__table.item(row, 0).text(),
-                self.__table.item(row, 1).text(),
-                self.__table.item(row, 2).text(),
-                self.__table.item(row, 3).text(),
-                self.__table.item(row, 4).text(),
-            ]
-            self.__model[MEMORIES].append(entry)
+    def __current_row(self):
+        # Selected row or -1
+        return self.__table.currentIndex().row()
         
\ No newline at end of file
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+#
+# memtable.py
+#
+# Copyright (C) 2021 by G3UKB Bob Cowdery
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#  The author can be reached by email at:
+#     bob@bobcowdery.plus.com
+#
+
+"""
+----------------------------------------------------------------------
+ Memories table model.
+
+ The table view reads the memories straight from the model's MEMORIES
+ list, which is edited in place, so only the rows that change are
+ touched and nothing is copied between the view and the configuration.
+ Each memory is [name, freq, band, tx, ant] with the frequency as
+ entered, the band label and the capacitor angles as integers.
+----------------------------------------------------------------------
+"""
+
+# PyQt5 imports
+from PyQt5 import QtCore
+
+# Column headings, in memory order
+COLUMNS = ('Name', 'Freq', 'Band', 'TX Cap', 'Ant Cap')
+# First of the angle columns
+ANGLE_COLUMN = 3
+
+def memory(name, freq, band, tx, ant):
+    """ A memory as held in the table """
+
+    return [str(name), str(freq), str(band), int(tx), int(ant)]
+
+class MemoryTable(QtCore.QAbstractTableModel):
+
+    def __init__(self, memories):
+        """
+        Constructor
+
+        Arguments:
+            memories    -- the model MEMORIES list, changed in place
+
+        """
+
+        super(MemoryTable, self).__init__()
+
+        self.__memories = memories
+
+    #------------------------------------------------------------------
+    # Qt model interface
+
+    def rowCount(self, parent = QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.__memories)
+
+    def columnCount(self, parent = QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(COLUMNS)
+
+    def data(self, index, role = QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            return str(self.__memories[index.row()][index.column()])
+        if role == QtCore.Qt.TextAlignmentRole and index.column() >= ANGLE_COLUMN:
+            return QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter
+        return None
+
+    def headerData(self, section, orientation, role = QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return COLUMNS[section]
+        return super(MemoryTable, self).headerData(section, orientation, role)
+
+    #------------------------------------------------------------------
+    # PUBLIC
+
+    def memory(self, row):
+        """ The memory at a row as (name, freq, band, tx, ant) """
+
+        return tuple(self.__memories[row])
+
+    def add(self, entry):
+        """
+        Append a memory, returns its row
+
+        Arguments:
+            entry   -- from memory()
+
+        """
+
+        row = len(self.__memories)
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self.__memories.append(entry)
+        self.endInsertRows()
+        return row
+
+    def update(self, row, entry):
+        """
+        Replace the memory at a row
+
+        Arguments:
+            row     -- row to replace
+            entry   -- from memory()
+
+        """
+
+        self.__memories[row] = entry
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(COLUMNS) - 1))
+
+    def remove(self, row):
+        """ Remove the memory at a row """
+
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        del self.__memories[row]
+        self.endRemoveRows()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+#
+# throttle.py
+#
+# Copyright (C) 2021 by G3UKB Bob Cowdery
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#  The author can be reached by email at:
+#     bob@bobcowdery.plus.com
+#
+
+"""
+----------------------------------------------------------------------
+ Outbound move shaping.
+
+ A slider in track mode changes value on every pixel dragged, far faster
+ than a servo can follow. Each axis has a throttle which sends the first
+ value at once and then at most one value per period, always the latest,
+ so intermediate values are dropped and the final value always goes.
+ Runs in the Qt thread on a single shot timer.
+----------------------------------------------------------------------
+"""
+
+# PyQt5 imports
+from PyQt5 import QtCore
+
+class MoveThrottle:
+
+    def __init__(self, send, rate):
+        """
+        Constructor
+
+        Arguments:
+            send    -- callable(value) to send a move
+            rate    -- most sends per second
+
+        """
+
+        self.__send = send
+        # Latest value not yet sent or None
+        self.__pending = None
+        # Running while inside a period since the last send
+        self.__timer = QtCore.QTimer()
+        self.__timer.setSingleShot(True)
+        self.__timer.timeout.connect(self.__expired)
+        self.set_rate(rate)
+
+    #------------------------------------------------------------------
+    # PUBLIC
+
+    def set_rate(self, rate):
+        """ Most sends per second """
+
+        self.__timer.setInterval(max(1, int(1000 / max(1, rate))))
+
+    def post(self, value):
+        """ Send now if idle else keep as the next value to send """
+
+        if self.__timer.isActive():
+            self.__pending = value
+        else:
+            self.__pending = None
+            self.__send(value)
+            self.__timer.start()
+
+    def cancel(self):
+        """ Drop any value waiting, e.g. when a move has been sent directly """
+
+        self.__pending = None
+
+    #------------------------------------------------------------------
+    # PRIVATE
+
+    def __expired(self):
+
+        if self.__pending != None:
+            value = self.__pending
+            self.__pending = None
+            self.__send(value)
+            # The trailing send starts another period
+            self.__timer.start()
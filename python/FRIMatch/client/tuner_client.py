@@ -28,6 +28,13 @@ from imports import *
 # Main application window
 class TunerClient(QMainWindow):
     
+    # Events from the monitor thread, (evt, params), encoding
+    monitor_event = QtCore.pyqtSignal(object, str)
+    # A memory upload batch has gone, upload, reliable.SEND_* status
+    upload_sent = QtCore.pyqtSignal(int, int)
+    # A command was never delivered, command type
+    send_failed = QtCore.pyqtSignal(str)
+    
     def __init__(self, path, qt_app):
         
         super(TunerClient, self).__init__()
@@ -40,6 +47,9 @@ class TunerClient(QMainWindow):
             print ('Configuration not found, using defaults')
             self.__model = model.auto_tune_model
             self.__configured = False
+        model.upgrade_model(self.__model)
+        # Inductor bands, one range button each
+        self.__bands = model.band_table(self.__model)
         # Create a datagram socket
         self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.__sock.bind(('', model.auto_tune_model[CONFIG][RPi][EVNT_PORT]))
@@ -48,13 +58,44 @@ class TunerClient(QMainWindow):
         # The application
         self.__qt_app = qt_app
         
-        # Heartbeat from server
+        # Heartbeat from server, checked every HEARTBEAT_CHECK ms
         self.__heartbeat = False
-        self.__heartbeat_timer = HEARTBEAT_TIMER
+        self.__heartbeat_timer = QtCore.QTimer()
+        self.__heartbeat_timer.setInterval(HEARTBEAT_CHECK)
+        self.__heartbeat_timer.timeout.connect(self.__check_heartbeat)
+        # Keep our event subscription alive while online
+        self.__subscribe_timer = QtCore.QTimer()
+        self.__subscribe_timer.setInterval(SUBSCRIBE_PERIOD)
+        self.__subscribe_timer.timeout.connect(self.__subscribe)
+        
+        # Link latency and clock offset, probed while online
+        self.__link = ping.LinkEstimator()
+        self.__ping_timer = QtCore.QTimer()
+        self.__ping_timer.setInterval(PING_PERIOD)
+        self.__ping_timer.timeout.connect(self.__ping)
+        
+        # Track moves per capacitor, latest wins at up to TRACK_RATE a second
+        rate = self.__model[CONFIG][SERVO][TRACK_RATE]
+        self.__tx_throttle = throttle.MoveThrottle(lambda val: self.__net_send([CMD_TX_SERVO_MOVE, self.__move_params(val, MOVE_TRACK)]), rate)
+        self.__ant_throttle = throttle.MoveThrottle(lambda val: self.__net_send([CMD_ANT_SERVO_MOVE, self.__move_params(val, MOVE_TRACK)]), rate)
         
         # Server
         self.__alive = False
-        self.__settings = False
+        # Start in pickle until the server answers in binary
+        self.__encoding = protocol.ENC_PICKLE
+        self.__batch_id = 0
+        # Memory upload in progress, batches still to send, one at a time
+        self.__upload_id = 0
+        self.__uploads = []
+        self.__upload_note = ''
+        self.upload_sent.connect(self.__upload_sent, QtCore.Qt.QueuedConnection)
+        self.send_failed.connect(self.__send_failed, QtCore.Qt.QueuedConnection)
+        # Tells the server our sequence numbers start again
+        self.__session = reliable.new_session()
+        # All sends go out on the sender thread, acked and retried when the server speaks binary,
+        # running before the UI is populated as that sends the initial range
+        self.__reliable = reliable.ReliableSender(self.__transmit)
+        self.__reliable.start()
         
         # Track progress
         self.__tx_progress = 0
@@ -80,6 +121,9 @@ class TunerClient(QMainWindow):
         self.__connect_status = QLabel("Tuner: offline")
         self.statusBar.insertPermanentWidget(0, self.__connect_status)
         self.__connect_status.setStyleSheet("color: red; font: 14px; font-family: Courier;")
+        self.__link_status = QLabel("")
+        self.statusBar.insertPermanentWidget(1, self.__link_status)
+        self.__link_status.setStyleSheet("font: 14px; font-family: Courier;")
 
         # Initialise the GUI
         self.__initUI()
@@ -87,7 +131,8 @@ class TunerClient(QMainWindow):
         # Populate
         self.__populate()
         
-        # Start monitor thread
+        # Start monitor thread, events are handled here on the GUI thread
+        self.monitor_event.connect(self.__on_event, QtCore.Qt.QueuedConnection)
         self.__monitor = Monitor(self.__sock, self.__monitor_callback)
         self.__monitor.start()
         
@@ -95,7 +140,7 @@ class TunerClient(QMainWindow):
         self.__config_win = config.Config(self.__model, self.__config_callback)
         
         # Create the memories window
-        self.__mem_win = memories.Memories(self.__model, self.settings, self.__mem_callback)
+        self.__mem_win = memories.Memories(self.__model, self.settings, self.__mem_callback, self.__upload_memories)
         
         # Set default range
         self.__servo_min = self.__model[CONFIG][SERVO][ANT_LOW_PWM]
@@ -170,14 +215,14 @@ class TunerClient(QMainWindow):
         range_lbl = QLabel("Select Range")
         self.__rangegrid.addWidget(range_lbl, 0,0)
         
-        self.__crb_low_range = QRadioButton(self.__model[CONFIG][RELAY][LOW_RANGE][LABEL])
-        self.__crb_low_range.setToolTip('Check box to select low frequency range')
-        self.__rangegrid.addWidget(self.__crb_low_range, 0,1)
-        self.__crb_high_range = QRadioButton(self.__model[CONFIG][RELAY][HIGH_RANGE][LABEL])
-        self.__crb_high_range.setToolTip('Check box to select high frequency range')
-        self.__rangegrid.addWidget(self.__crb_high_range, 0,2)
-        self.__crb_low_range.toggled.connect(lambda:self.__do_range_changed(self.__crb_low_range))
-        self.__crb_high_range.toggled.connect(lambda:self.__do_range_changed(self.__crb_high_range))
+        # Band label : button
+        self.__crb_bands = {}
+        for n, band in enumerate(self.__bands):
+            rb = QRadioButton(band.label)
+            rb.setToolTip('Check box to select %s - %s MHz' % (str(band.low), str(band.high)))
+            self.__rangegrid.addWidget(rb, 0,n+1)
+            rb.toggled.connect(lambda checked, band=band: self.__do_range_changed(band, checked))
+            self.__crb_bands[band.label] = rb
         
         #=======================================================
         # Capacitor area
@@ -287,10 +332,10 @@ class TunerClient(QMainWindow):
     # Populate UI
     def __populate(self, ):
         
-        if self.__model[CONFIG][RELAY][LOW_RANGE][ENERGISE]:
-            self.__crb_low_range.setChecked(True)
-        else:
-            self.__crb_high_range.setChecked(True)
+        # Lowest band until the server says otherwise
+        for band in self.__bands:
+            self.__crb_bands[band.label].setChecked(True)
+            break
             
         if self.__model[CONFIG][SERVO][MODE] == MODE_TRACK:
             self.__crb_track.setChecked(True)
@@ -302,8 +347,9 @@ class TunerClient(QMainWindow):
     def run(self, ):
         """ Run the application """
         
-        # Start idle processing
-        QtCore.QTimer.singleShot(IDLE_TICKER, self.__idleProcessing)
+        # Offline until the server answers
+        self.__set_online(False)
+        self.__heartbeat_timer.start()
         
         # Returns when application exits
         # Show the GUI
@@ -319,12 +365,14 @@ class TunerClient(QMainWindow):
     #========================================================================================
     # Get settings
     def settings(self, ):
-        low = self.__crb_low_range.isChecked()
-        high = self.__crb_low_range.isChecked()
+        band = ''
+        for label, rb in self.__crb_bands.items():
+            if rb.isChecked():
+                band = label
         tx = self.__tx_cap.value()
         ant = self.__ant_cap.value()
         
-        return (low, high, tx, ant)
+        return (band, tx, ant)
 
     #=======================================================
     # Window events
@@ -343,6 +391,14 @@ class TunerClient(QMainWindow):
         
         # Close memory win
         self.__mem_win.close()
+        
+        # Stop events
+        if self.__alive and self.__encoding == protocol.ENC_BINARY:
+            self.__net_send([CMD_UNSUBSCRIBE, [self.__model[CONFIG][RPi][EVNT_PORT]]])
+        
+        # Stop the sender once the unsubscribe has gone
+        self.__reliable.terminate()
+        self.__reliable.join()
 
         # Close socket
         self.__sock.close()
@@ -382,111 +438,144 @@ class TunerClient(QMainWindow):
         # Value ranges 0 - 180
         val = self.__tx_cap.value()
         if self.__crb_track.isChecked():
-            self.__net_send([CMD_TX_SERVO_MOVE, [val]])
+            self.__tx_throttle.post(val)
         self.__tx_cap_val.setText(str(val))
     
     def __tx_cap_released(self):
         # Value ranges 0 - 180
         val = self.__tx_cap.value()
         if self.__crb_wait.isChecked():
-            self.__net_send([CMD_TX_SERVO_MOVE, [val]])
+            self.__tx_throttle.cancel()
+            self.__net_send([CMD_TX_SERVO_MOVE, self.__move_params(val, MOVE_SCAN)])
         self.__tx_cap_val.setText(str(val))
 
     def __ant_cap_changed(self):
         # Value ranges 0 - 180
         val = self.__ant_cap.value()
         if self.__crb_track.isChecked():
-            self.__net_send([CMD_ANT_SERVO_MOVE, [val]])
+            self.__ant_throttle.post(val)
         self.__ant_cap_val.setText(str(val))
 
     def __ant_cap_released(self):
         # Value ranges 0 - 180
         val = self.__ant_cap.value()
         if self.__crb_wait.isChecked():
-            self.__net_send([CMD_ANT_SERVO_MOVE, [val]])
+            self.__ant_throttle.cancel()
+            self.__net_send([CMD_ANT_SERVO_MOVE, self.__move_params(val, MOVE_SCAN)])
         self.__ant_cap_val.setText(str(val))
         
     # Do nudge up/down
     def __do_tx_nudge_down(self):
         val = self.__tx_cap.value() - self.__get_inc()
-        self.__do_nudge(self.__tx_cap, self.__tx_cap_val, CMD_TX_SERVO_MOVE, val)
+        self.__do_nudge(self.__tx_cap, self.__tx_cap_val, self.__tx_throttle, val)
     
     def __do_tx_nudge_up(self):
         val = self.__tx_cap.value() + self.__get_inc()
-        self.__do_nudge(self.__tx_cap, self.__tx_cap_val, CMD_TX_SERVO_MOVE, val)
+        self.__do_nudge(self.__tx_cap, self.__tx_cap_val, self.__tx_throttle, val)
     
     def __do_ant_nudge_down(self):
         val = self.__ant_cap.value() - self.__get_inc()
-        self.__do_nudge(self.__ant_cap, self.__ant_cap_val, CMD_ANT_SERVO_MOVE, val)
+        self.__do_nudge(self.__ant_cap, self.__ant_cap_val, self.__ant_throttle, val)
     
     def __do_ant_nudge_up(self):
         val = self.__ant_cap.value() + self.__get_inc()
-        self.__do_nudge(self.__ant_cap, self.__ant_cap_val, CMD_ANT_SERVO_MOVE, val)
+        self.__do_nudge(self.__ant_cap, self.__ant_cap_val, self.__ant_throttle, val)
+    
+    def __move_params(self, val, mode):
+        # Servers that only speak pickle predate move profiles
+        if self.__encoding == protocol.ENC_BINARY:
+            return [val, mode]
+        return [val]
     
     def __get_inc(self):
         return self.__model[CONFIG][SERVO][NUDGE_INC]
         
-    def __do_nudge(self, w_slider, w_value, cmd, val):
+    def __do_nudge(self, w_slider, w_value, move_throttle, val):
         if val >= 0 and val <=180:
-            self.__net_send([cmd, [val]])
-            w_value.setText(str(val))
+            # Moving the slider would post the value again
+            w_slider.blockSignals(True)
             w_slider.setValue(val)
+            w_slider.blockSignals(False)
+            move_throttle.post(val)
+            w_value.setText(str(val))
         
     #=======================================================
     # Set server to band paramters
-    def __do_range_changed(self, rb):
+    def __do_range_changed(self, band, checked):
+        # Only the button checked, not the one it unchecks
+        if not checked:
+            return
         # Collect parameters
         params = []
         inv = self.__model[CONFIG][RELAY][RELAY_INVERSE]
         for pin in self.__model[CONFIG][RELAY][INDUCTOR_PINMAP]:
             params.append((pin, inv))
-            
-        # Do a complete relay init
-        self.__net_send([CMD_RELAYS_INIT, params])
         
-        # Set relays for bands
-        if rb.text() == self.__model[CONFIG][RELAY][LOW_RANGE][LABEL]:
-            if rb.isChecked() == True:
-                self.__net_send([CMD_RELAYS_RESET, params])
-        if rb.text() == self.__model[CONFIG][RELAY][HIGH_RANGE][LABEL]:
-            if rb.isChecked() == True:
-                self.__net_send([CMD_RELAYS_SET, params])
+        if self.__encoding == protocol.ENC_BINARY:
+            # Relays only, break before make
+            self.__net_send([CMD_TUNE, [params, band.taps, MEMORY_NO_ANGLE, MEMORY_NO_ANGLE, MOVE_SCAN]])
+        else:
+            for cmd in self.__relay_cmds(params, band):
+                self.__net_send(cmd)
         
     #======================================================= 
-    def __idleProcessing(self):
-        # Update UI with actual progress
-        self.__tx_cap_actual.setText(str(self.__tx_progress))
-        self.__ant_cap_actual.setText(str(self.__ant_progress))
-        
-        # Check heartbeat
-        self.__heartbeat_timer -= 1
-        if self.__heartbeat_timer <= 0:
-            # Check now      
-            if self.__heartbeat:
-                self.__alive = True
-                self.__heartbeat = False
-                self.__connect_status.setText("Tuner: online")
-                self.__connect_status.setStyleSheet("color: green; font: 14px; font-family: Courier;")
-                self.__set_enabled(True)
-                self.__config_win.tuner_status(True)
-                if not self.__settings:
-                    self.__send_settings()
-                    self.__settings = True
-            else:
-                # Send wakeup
-                self.__net_send([CMD_WAKEUP, ()])
-                # Alert
-                self.__connect_status.setText("Tuner: offline")
-                self.__connect_status.setStyleSheet("color: red; font: 14px; font-family: Courier;")
-                self.__alive = False
-                self.__settings = False
-                self.__set_enabled(False)
-                self.__config_win.tuner_status(False)
-            self.__heartbeat_timer = HEARTBEAT_TIMER
-        
-        # Set timer
-        QtCore.QTimer.singleShot(IDLE_TICKER, self.__idleProcessing)
+    # Timers
+    def __check_heartbeat(self):
+        if self.__heartbeat:
+            self.__heartbeat = False
+            if not self.__alive:
+                self.__set_online(True)
+        else:
+            # Send wakeup, always pickled with our protocol version so any server understands it
+            self.__encoding = protocol.ENC_PICKLE
+            self.__net_send([CMD_WAKEUP, (protocol.PROTOCOL_VERSION,)])
+            if self.__alive:
+                self.__set_online(False)
+    
+    def __set_online(self, online):
+        # Only on a change of state
+        self.__alive = online
+        if online:
+            self.__connect_status.setText("Tuner: online")
+            self.__connect_status.setStyleSheet("color: green; font: 14px; font-family: Courier;")
+            self.__send_settings()
+            if self.__encoding == protocol.ENC_BINARY:
+                self.__subscribe()
+                self.__subscribe_timer.start()
+                self.__ping()
+                self.__ping_timer.start()
+        else:
+            self.__connect_status.setText("Tuner: offline")
+            self.__connect_status.setStyleSheet("color: red; font: 14px; font-family: Courier;")
+            self.__subscribe_timer.stop()
+            self.__ping_timer.stop()
+            self.__link_status.setText("")
+        self.__set_enabled(online)
+        self.__config_win.tuner_status(online)
+    
+    def __subscribe(self):
+        if self.__encoding == protocol.ENC_BINARY:
+            self.__net_send([CMD_SUBSCRIBE, [SUB_ALL, self.__model[CONFIG][RPi][EVNT_PORT]]])
+    
+    def __ping(self):
+        # Never retried, a lost ping is just a lost sample
+        if self.__encoding == protocol.ENC_BINARY:
+            self.__reliable.send(CMD_PING, [ping.now_us()], acked = False)
 
+    def __show_link(self):
+        rtt = self.__link.rtt()
+        if rtt == None:
+            return
+        self.__link_status.setText("RTT %.1f ms +/- %.1f  offset %.1f ms" % (rtt * 1000, self.__link.jitter() * 1000, self.__link.offset() * 1000))
+    
+    def __show_progress(self, tx, ant):
+        if tx != self.__tx_progress:
+            self.__tx_progress = tx
+            self.__tx_cap_actual.setText(str(tx))
+        if ant != self.__ant_progress:
+            self.__ant_progress = ant
+            self.__ant_cap_actual.setText(str(ant))
+    
     def __set_enabled(self, online):
         if online and self.__configured:
             self.__w2.setEnabled(True)
@@ -505,26 +594,153 @@ class TunerClient(QMainWindow):
             self.__model[CONFIG][SERVO][SCAN_DELAY]
         )
         self.__net_send([CMD_SERVO_SETTINGS, params])
-        # Send the servos home
-        self.__net_send([CMD_TX_SERVO_HOME, []])
-        sleep(2)
-        self.__net_send([CMD_ANT_SERVO_HOME, []])
+        if self.__encoding == protocol.ENC_BINARY:
+            # The server knows where everything is, show that rather than homing
+            self.__net_send([CMD_GET_STATE, []])
+            # Keep the server's memories in step with ours
+            self.__upload_memories()
+        else:
+            # Send the servos home, the server runs each servo separately
+            self.__net_send([CMD_TX_SERVO_HOME, []])
+            self.__net_send([CMD_ANT_SERVO_HOME, []], delay = HOME_DELAY)
+    
+    def __show_state(self, state):
+        tx, ant, tx_commanded, ant_commanded, taps = state
+        self.__show_progress(tx, ant)
+        self.__set_controls(self.__bands.by_taps(taps), tx_commanded, ant_commanded)
+        
+    def __upload_memories(self):
+        # Servers that only speak pickle have no memory store
+        if self.__encoding != protocol.ENC_BINARY:
+            return
+        pins = []
+        inv = self.__model[CONFIG][RELAY][RELAY_INVERSE]
+        for pin in self.__model[CONFIG][RELAY][INDUCTOR_PINMAP]:
+            pins.append((pin, inv))
+        mems = self.__model[MEMORIES]
+        note = ''
+        if len(mems) > MAX_MEMORIES:
+            note = 'The tuner holds %d memories, the last %d are not uploaded' % (MAX_MEMORIES, len(mems) - MAX_MEMORIES)
+            print(note)
+            mems = mems[:MAX_MEMORIES]
+        # Each memory with the bytes it adds to a batch, numbered over those uploaded
+        # so the tuner's table has no gaps
+        empty = self.__batch_size([])
+        stores = []
+        for name, freq, ind, tx, ant in mems:
+            taps = self.__memory_taps(ind, freq)
+            cmd = [CMD_MEMORY_STORE, [len(stores), name, freq, taps, self.__memory_angle(tx), self.__memory_angle(ant)]]
+            size = self.__batch_size([cmd])
+            if size == None or size > protocol.MAX_REQUEST:
+                note = 'Memory %s is too long to upload, shorten its name or frequency' % name
+                print(note)
+                continue
+            stores.append((cmd, size - empty))
+        # As many as fit in a datagram
+        batches = []
+        cmds = [[CMD_MEMORIES_INIT, [pins, len(stores)]]]
+        size = self.__batch_size(cmds)
+        for cmd, length in stores:
+            if size + length > protocol.MAX_REQUEST:
+                batches.append(cmds)
+                cmds = []
+                size = empty
+            cmds.append(cmd)
+            size += length
+        batches.append(cmds)
+        # Replaces any upload still going, the next batch goes when the last is acked
+        self.__upload_id += 1
+        self.__uploads = batches
+        self.__upload_note = note
+        self.__upload_sent(self.__upload_id, reliable.SEND_OK)
+    
+    def __upload_sent(self, upload, status):
+        # On the GUI thread when an upload batch has gone
+        if upload != self.__upload_id:
+            # Replaced by a later upload
+            return
+        if status != reliable.SEND_OK or self.__encoding != protocol.ENC_BINARY:
+            self.statusBar.showMessage('Memory upload failed, the tuner has not got all the memories')
+            self.__uploads = []
+            return
+        if len(self.__uploads) == 0:
+            if len(self.__upload_note) > 0:
+                self.statusBar.showMessage(self.__upload_note)
+            return
+        future = self.__net_send_batch(self.__uploads.pop(0))
+        future.add_done_callback(lambda future: self.upload_sent.emit(upload, future.result()))
+    
+    def __batch_size(self, cmds):
+        # Bytes the commands take as one batch, None if they can't be encoded
+        try:
+            return len(protocol.encode_command(CMD_BATCH, [0, cmds]))
+        except protocol.ProtocolError:
+            return None
+    
+    def __memory_angle(self, angle):
+        angle = int(angle)
+        if angle < 0 or angle > 180:
+            return MEMORY_NO_ANGLE
+        return angle
+    
+    def __memory_taps(self, ind, freq):
+        band = self.__bands.resolve(ind, freq)
+        if band == None:
+            return TAPS_UNKNOWN
+        return band.taps
+    
+    def __relay_cmds(self, params, band):
+        # Older servers only set or reset, set energises just the pins given
+        cmds = [[CMD_RELAYS_INIT, params]]
+        if band == None:
+            return cmds
+        if band.taps == 0:
+            cmds.append([CMD_RELAYS_RESET, params])
+        else:
+            cmds.append([CMD_RELAYS_SET, bands.tap_pins(params, band.taps)])
+        return cmds
         
     #======================================================= 
     # Callbacks
     #======================================================= 
-    def __monitor_callback(self, data):
-        if data[0] == 'heartbeat':
+    def __monitor_callback(self, data, encoding):
+        # On the monitor thread, acks go straight to the sender and
+        # everything else is queued to the GUI thread
+        if data[0] == EVNT_ACK:
+            self.__reliable.ack(data[1])
+        else:
+            self.monitor_event.emit(data, encoding)
+    
+    def __on_event(self, data, encoding):
+        if data[0] == EVNT_HEARTBEAT:
             self.__heartbeat = True
-        elif data[0] == 'tx':    
-            self.__tx_progress = data[1]
-        elif data[0] == 'ant':
-            self.__ant_progress = data[1]
+            # Talk to the server in whatever it answers in
+            self.__encoding = encoding
+        elif data[0] == EVNT_TX:
+            self.__show_progress(data[1], self.__ant_progress)
+        elif data[0] == EVNT_ANT:
+            self.__show_progress(self.__tx_progress, data[1])
+        elif data[0] == EVNT_POS:
+            self.__show_progress(*data[1])
+        elif data[0] == EVNT_STATE:
+            # Catch up with the server after connecting
+            self.__show_state(data[1])
+        elif data[0] == EVNT_PONG:
+            t1, t2, t3 = data[1]
+            delay, offset = self.__link.sample(t1, t2, t3, ping.now_us())
+            # Also tunes the retransmit timer
+            self.__reliable.sample(delay / 1000000)
+            self.__show_link()
             
     def __config_callback(self, cmd, params):
+        if cmd == CMD_SERVO_SETTINGS:
+            # The track rate is local to the client
+            rate = self.__model[CONFIG][SERVO][TRACK_RATE]
+            self.__tx_throttle.set_rate(rate)
+            self.__ant_throttle.set_rate(rate)
         self.__net_send([cmd, params])
 
-    def __mem_callback(self, ind, tx, ant):
+    def __mem_callback(self, freq, ind, tx, ant):
         # Execute settings, set interface
         
         # Collect parameters for relays
@@ -532,29 +748,90 @@ class TunerClient(QMainWindow):
         inv = self.__model[CONFIG][RELAY][RELAY_INVERSE]
         for pin in self.__model[CONFIG][RELAY][INDUCTOR_PINMAP]:
             params.append((pin, inv))
-        # Set relays and adjust UI
-        if ind == 'low-range':
-            self.__crb_low_range.setChecked(True)
-            self.__net_send([CMD_RELAYS_RESET, params])
-        if ind == 'high-range':
-            self.__crb_high_range.setChecked(True)
-            self.__net_send([CMD_RELAYS_SET, params])
-        # Set caps and adjust UI
+        # Band by name, else the one the frequency falls in
+        band = self.__bands.resolve(ind, freq)
         tx = int(tx)
-        if tx >= 0 and tx <=180:
-            self.__net_send([CMD_TX_SERVO_MOVE, [tx]])
+        ant = int(ant)
+        tx_ok = tx >= 0 and tx <=180
+        ant_ok = ant >= 0 and ant <=180
+        # A drag still being sent must not follow the memory
+        self.__tx_throttle.cancel()
+        self.__ant_throttle.cancel()
+        if self.__encoding == protocol.ENC_BINARY:
+            # The server sequences relays and caps as one tune
+            taps = self.__memory_taps(ind, freq)
+            self.__net_send([CMD_TUNE, [params, taps, self.__memory_angle(tx), self.__memory_angle(ant), MOVE_SCAN]])
+        else:
+            # Set relays
+            cmds = self.__relay_cmds(params, band)
+            # Set caps
+            if tx_ok:
+                cmds.append([CMD_TX_SERVO_MOVE, self.__move_params(tx, MOVE_SCAN)])
+            if ant_ok:
+                cmds.append([CMD_ANT_SERVO_MOVE, self.__move_params(ant, MOVE_SCAN)])
+            self.__net_send_batch(cmds)
+        
+        if not tx_ok:
+            tx = None
+        if not ant_ok:
+            ant = None
+        self.__set_controls(band, tx, ant)
+    
+    def __set_controls(self, band, tx, ant):
+        # Adjust UI without the widgets sending their own commands
+        widgets = list(self.__crb_bands.values()) + [self.__tx_cap, self.__ant_cap]
+        for w in widgets:
+            w.blockSignals(True)
+        if band != None:
+            self.__crb_bands[band.label].setChecked(True)
+        if tx != None:
             self.__tx_cap.setValue(tx)
             self.__tx_cap_val.setText(str(tx))
-        ant = int(ant)
-        if ant >= 0 and ant <=180:
-            self.__net_send([CMD_ANT_SERVO_MOVE, [ant]])
+        if ant != None:
             self.__ant_cap.setValue(ant)
             self.__ant_cap_val.setText(str(ant))
+        for w in widgets:
+            w.blockSignals(False)
             
     #======================================================= 
     # Net send
-    def __net_send(self, data):
-        self.__sock.sendto(pickle.dumps(data), (self.__model[CONFIG][RPi][IP], self.__model[CONFIG][RPi][RQST_PORT]))
+    def __net_send_batch(self, cmds):
+        # Returns the batch's future with binary, None otherwise
+        if self.__encoding == protocol.ENC_BINARY:
+            self.__batch_id = (self.__batch_id + 1) & 0xFFFF
+            return self.__net_send([CMD_BATCH, [self.__batch_id, cmds]])
+        else:
+            # Server predates batches
+            for cmd in cmds:
+                self.__net_send(cmd)
+    
+    def __net_send(self, data, delay = 0):
+        # Queued for the sender thread, returns a future with the reliable.SEND_* status
+        # No acks from servers that only speak pickle. Moves are latest wins so may be
+        # dropped when the queue is full, anything else waits for room.
+        future = self.__reliable.send(data[0], data[1], delay = delay, acked = self.__encoding == protocol.ENC_BINARY, wait = data[0] not in reliable.NO_RETRY)
+        future.add_done_callback(lambda future: self.__sent(data[0], future))
+        return future
+    
+    def __sent(self, cmd, future):
+        # On the sender thread, tell the GUI about anything lost
+        if future.result() == reliable.SEND_FAILED:
+            self.send_failed.emit(cmd)
+    
+    def __send_failed(self, cmd):
+        self.statusBar.showMessage('%s was not delivered to the tuner' % cmd)
+    
+    def __transmit(self, cmd, params, rid, seq):
+        # On the sender thread
+        if seq != 0 and self.__encoding != protocol.ENC_BINARY:
+            # Server went away, retries would not be acked
+            return
+        try:
+            encodedData = protocol.encode_command(cmd, params, self.__encoding, rid, seq, self.__session)
+        except protocol.ProtocolError as e:
+            print('Failed to encode command [%s]' % str(e))
+            return
+        self.__sock.sendto(encodedData, (self.__model[CONFIG][RPi][IP], self.__model[CONFIG][RPi][RQST_PORT]))
     
 #======================================================================================================================
 # Monitor thread
@@ -584,11 +861,14 @@ class Monitor(threading.Thread):
         while not self.__terminate:
             try:
                 data, self.__address = self.__sock.recvfrom(100)
-                self.__callback(pickle.loads(data))
+                evt, params, encoding = protocol.decode_event(data)
+                self.__callback((evt, params), encoding)
             except socket.timeout:
                 continue
             except ConnectionResetError:
                 continue
+            except protocol.ProtocolError as e:
+                print('Invalid event data [%s]' % str(e))
             except:
                 print("Unexpected error on socket.recvFrom():", sys.exc_info()[0])
                 
@@ -42,6 +42,7 @@ MODE: 'MODE'
 NUDGE_INC = 'NUDGE_INC'
 TRACK_INC = 'TRACK_INC'
 TRACK_DELAY = 'TRACK_DELAY'
+TRACK_RATE = 'TRACK_RATE'
 SCAN_INC = 'SCAN_INC'
 SCAN_DELAY = 'SCAN_DELAY'
 # Relay section
@@ -53,6 +54,7 @@ HIGH_RANGE = 'HIGH-RANGE'
 FREQ = 'FREQ'
 LABEL = 'LABEL'
 ENERGISE = 'ENERGISE'
+BANDS = 'BANDS'
 # State section
 MAIN_WIN = 'MAIN_WIN'
 CONFIG_WIN = 'CONFIG_WIN'
@@ -63,6 +65,7 @@ MODE_SCAN = 'MODE_SCAN'
 DEFAULT_NUDGE_INC = 2
 DEFAULT_TRACK_INC = 1
 DEFAULT_TRACK_DELAY = 20    # ms
+DEFAULT_TRACK_RATE = 20     # moves per second per capacitor
 DEFAULT_SCAN_INC = 1
 DEFAULT_SCAN_DELAY = 20     # ms
 
@@ -78,17 +81,38 @@ CMD_TX_SERVO_SET_PWM = 'CMD_TX_SERVO_SET_PWM'
 CMD_TX_SERVO_TEST = 'CMD_TX_SERVO_TEST'
 CMD_TX_SERVO_HOME = 'CMD_TX_SERVO_HOME'
 CMD_TX_SERVO_MOVE = 'CMD_TX_SERVO_MOVE'
+CMD_TX_SERVO_STOP = 'CMD_TX_SERVO_STOP'
 CMD_ANT_SERVO_SET_PWM = 'CMD_ANT_SERVO_SET_PWM'
 CMD_ANT_SERVO_TEST = 'CMD_ANT_SERVO_TEST'
 CMD_ANT_SERVO_HOME = 'CMD_ANT_SERVO_HOME'
 CMD_ANT_SERVO_MOVE = 'CMD_ANT_SERVO_MOVE'
+CMD_ANT_SERVO_STOP = 'CMD_ANT_SERVO_STOP'
+# External commands for both servos together
+CMD_SERVOS_MOVE = 'CMD_SERVOS_MOVE'
+CMD_SERVOS_HOME = 'CMD_SERVOS_HOME'
 # External servo general settings
 CMD_SERVO_SETTINGS = 'CMD_SERVO_SETTINGS'
+# Position reports per second while moving, [rate]
+CMD_PROGRESS_RATE = 'CMD_PROGRESS_RATE'
+# Event subscription, [mask, port] and [port]
+CMD_SUBSCRIBE = 'CMD_SUBSCRIBE'
+CMD_UNSUBSCRIBE = 'CMD_UNSUBSCRIBE'
+# Step timing counters for both servos, [clear]
+CMD_SERVO_STATS = 'CMD_SERVO_STATS'
+# Positions and relay state, answered with EVNT_STATE
+CMD_GET_STATE = 'CMD_GET_STATE'
+# Latency probe answered with EVNT_PONG, [client time us]
+CMD_PING = 'CMD_PING'
 
 # Internal servo commands
 CMD_SERVO_TEST = 'CMD_SERVO_TEST'
 CMD_SERVO_HOME = 'CMD_SERVO_HOME'
 CMD_SERVO_MOVE = 'CMD_SERVO_MOVE'
+CMD_SERVO_STOP = 'CMD_SERVO_STOP'
+
+# Move profiles
+MOVE_TRACK = 0
+MOVE_SCAN = 1
 
 # External relay commands
 CMD_RELAYS_INIT = 'CMD_RELAYS_INIT'
@@ -96,6 +120,45 @@ CMD_RELAYS_SET = 'CMD_RELAYS_SET'
 CMD_RELAYS_RESET = 'CMD_RELAYS_RESET'
 CMD_RELAYS_CYCLE = 'CMD_RELAYS_CYCLE'
 
+# Memories held by the server
+# Upload, [pins, count] then [id, name, freq, taps, tx, ant] for each
+CMD_MEMORIES_INIT = 'CMD_MEMORIES_INIT'
+CMD_MEMORY_STORE = 'CMD_MEMORY_STORE'
+# Set the tuner to a stored memory, [id]
+CMD_RECALL_MEMORY = 'CMD_RECALL_MEMORY'
+# Angle for a capacitor to stay where it is
+MEMORY_NO_ANGLE = 0xFF
+
+# Relays and both capacitors as one transaction with one EVNT_DONE
+# [pins, taps, tx, ant, mode], TAPS_UNKNOWN leaves the relays
+CMD_TUNE = 'CMD_TUNE'
+# Relay timing for CMD_TUNE and CMD_RECALL_MEMORY, [break ms, settle ms, overlap]
+CMD_TUNE_SETTINGS = 'CMD_TUNE_SETTINGS'
+
+# Batch of the above executed as one unit
+CMD_BATCH = 'CMD_BATCH'
+
 CMD_RESET = 'CMD_RESET'
 
+# Events
+EVNT_DONE = 'done'
+EVNT_ACK = 'ack'
+EVNT_PONG = 'pong'
+EVNT_STATE = 'state'
+
+# Inductor taps are a bitmask, bit n for pin n of the pins sent, see bands.py
+# Relays left alone, or in EVNT_STATE not known
+TAPS_UNKNOWN = 0xFFFF
+
+# EVNT_DONE status
+DONE_OK = 0
+DONE_REJECTED = 1
+DONE_SUPERSEDED = 2     # A later tune took over
+# Longest a memory should take to set, s
+DONE_TIMEOUT = 10
+
+# Tune transaction defaults, ms
+TUNE_BREAK = 20
+TUNE_SETTLE = 50
+
 
@@ -23,6 +23,7 @@
 
 # The application model contains persisted configuration and state data
 from defs import *
+import bands
 
 # -----------------------------------------------------------
 # IP helper
@@ -55,22 +56,18 @@ auto_tune_model = {
             NUDGE_INC: DEFAULT_NUDGE_INC,
             TRACK_INC: DEFAULT_TRACK_INC,
             TRACK_DELAY: DEFAULT_TRACK_DELAY,
+            TRACK_RATE: DEFAULT_TRACK_RATE,
             SCAN_INC: DEFAULT_SCAN_INC,
             SCAN_DELAY: DEFAULT_SCAN_DELAY,
         },
         RELAY: {
             INDUCTOR_PINMAP: [16, 19, 20, 21],
             RELAY_INVERSE: False,
-            LOW_RANGE: {
-                FREQ: (1.8, 10.15),
-                LABEL: '160m - 30m',
-                ENERGISE: True,
-            },
-            HIGH_RANGE: {
-                FREQ: (14.0, 30),
-                LABEL: '20m - 10m',
-                ENERGISE: False,
-            }
+            # (low MHz, high MHz, label, taps energised), taps bit n is pinmap entry n
+            BANDS: [
+                (1.8, 10.15, '160m - 30m', 0x0),
+                (14.0, 30, '20m - 10m', 0xF),
+            ]
         }
     },
     MEMORIES: [],
@@ -80,3 +77,30 @@ auto_tune_model = {
         MEM_WIN: [300,300,520,300]
     }
 }
+
+# -----------------------------------------------------------
+# Inductor bands
+def upgrade_model(model):
+    # Configurations from before track moves were rate limited
+    model[CONFIG][SERVO].setdefault(TRACK_RATE, DEFAULT_TRACK_RATE)
+    # Memories held the capacitor angles as strings from the table cells
+    for memory in model[MEMORIES]:
+        memory[3] = int(memory[3])
+        memory[4] = int(memory[4])
+    # Configurations from before the band table had a low and a high range,
+    # memories named them 'low-range' and 'high-range'
+    relay = model[CONFIG][RELAY]
+    if BANDS in relay:
+        return
+    ranges = (
+        (relay[LOW_RANGE], 0, 'low-range'),
+        (relay[HIGH_RANGE], bands.all_taps(len(relay[INDUCTOR_PINMAP])), 'high-range'),
+    )
+    relay[BANDS] = [(r[FREQ][0], r[FREQ][1], r[LABEL], taps) for r, taps, old in ranges]
+    for memory in model[MEMORIES]:
+        for r, taps, old in ranges:
+            if memory[2] == old:
+                memory[2] = r[LABEL]
+
+def band_table(model):
+    return bands.BandTable(model[CONFIG][RELAY][BANDS])
@@ -26,24 +26,54 @@
 # System imports
 import sys
 import traceback
-from time import sleep
+from time import sleep, monotonic
 import socket
-import pickle
 
 # Application imports
 from defs import *
+sys.path.append('../server')
 import model
 import persist
+import protocol
+import reliable
+import ping
+import bands
 
 """
     The Tuner API class
 """
 class Tuner_API:
     
-    def __init__(self, path):
+    def __init__(self, path, encoding = protocol.ENC_BINARY, address = None):
+        # address is the tuner (ip, port) if not from the configuration at path,
+        # with path None only memories held by the tuner can be recalled
+        # Wire encoding, use ENC_PICKLE for servers that predate the binary protocol
+        self.__encoding = encoding
+        self.__batch_id = 0
+        self.__rid = 0
+        
+        # Acked delivery, binary only
+        self.__seq = 0
+        self.__session = reliable.new_session()
+        self.__rtt = reliable.RttEstimator()
+        # Completions that arrived while waiting for an ack, rid : event data
+        self.__done = {}
+        # Link latency and clock offset, binary only
+        self.__link = ping.LinkEstimator()
+        
         # Retrieve model
-        self.__model = persist.getSavedCfg(path)
-        if self.__model == None:
+        self.__model = None
+        self.__bands = None
+        if path != None:
+            self.__model = persist.getSavedCfg(path)
+        if self.__model != None:
+            model.upgrade_model(self.__model)
+            self.__bands = model.band_table(self.__model)
+        if address != None:
+            self.__address = address
+        elif self.__model != None:
+            self.__address = (self.__model[CONFIG][RPi][IP], self.__model[CONFIG][RPi][RQST_PORT])
+        else:
             print ('Tuner configuration not found. Please run full tuner application to configure.')
             return
         
@@ -52,7 +82,15 @@ class Tuner_API:
         
     #=======================================================
     # Run tuner to given memory
-    def set_memory(self, memory_id):
+    # With the binary encoding this waits until the tuner has settled and
+    # returns the completion as (status, tx, ant, elapsed secs), None on
+    # timeout or False if the tuner never acknowledged the request. Servers
+    # that only speak pickle send no completion so then it returns True
+    # once sent.
+    def set_memory(self, memory_id, timeout = DONE_TIMEOUT):
+        if self.__model == None:
+            print("No tuner configuration, use recall_memory()")
+            return False
         # Retrieve memory data
         if memory_id < len(self.__model[MEMORIES]):
             name, freq, inductor, tx_cap, ant_cap = self.__model[MEMORIES][memory_id]
@@ -67,27 +105,201 @@ class Tuner_API:
         params = []
         for pin in self.__model[CONFIG][RELAY][INDUCTOR_PINMAP]:
             params.append((pin, inv))
-        # Set relays
-        self.__net_send([CMD_RELAYS_INIT, params])
-        if inductor == 'low-range':
-            self.__net_send([CMD_RELAYS_RESET, params])
-        if inductor == 'high-range':
-            self.__net_send([CMD_RELAYS_SET, params])
-            
-        # Set capacitors
+        # Band by name, else the one the frequency falls in
+        band = self.__bands.resolve(inductor, freq)
         tx_cap = int(tx_cap)
-        if tx_cap >= 0 and tx_cap <=180:
-            self.__net_send([CMD_TX_SERVO_MOVE, [tx_cap]])
         ant_cap = int(ant_cap)
-        if ant_cap >= 0 and ant_cap <=180:
-            self.__net_send([CMD_ANT_SERVO_MOVE, [ant_cap]])
+        tx_ok = tx_cap >= 0 and tx_cap <=180
+        ant_ok = ant_cap >= 0 and ant_cap <=180
+        if self.__encoding == protocol.ENC_BINARY:
+            # The tuner sequences relays and capacitors as one tune
+            if band != None:
+                taps = band.taps
+            else:
+                taps = TAPS_UNKNOWN
+            if not tx_ok:
+                tx_cap = MEMORY_NO_ANGLE
+            if not ant_ok:
+                ant_cap = MEMORY_NO_ANGLE
+            rid = self.__next_rid()
+            if not self.__net_send_reliable([CMD_TUNE, [params, taps, tx_cap, ant_cap, MOVE_SCAN]], rid):
+                rid = None
+        else:
+            # Set relays
+            cmds = [[CMD_RELAYS_INIT, params]]
+            if band != None and band.taps == 0:
+                cmds.append([CMD_RELAYS_RESET, params])
+            elif band != None:
+                cmds.append([CMD_RELAYS_SET, bands.tap_pins(params, band.taps)])
+            # Set capacitors
+            if tx_ok:
+                cmds.append([CMD_TX_SERVO_MOVE, self.__move_params(tx_cap)])
+            if ant_ok:
+                cmds.append([CMD_ANT_SERVO_MOVE, self.__move_params(ant_cap)])
+            rid = self.__net_send_batch(cmds)
+        if rid == None:
+            # Never acked
+            return False
             
         print("Set memory %s at frequency %s" %(name, freq))
+        if rid == 0:
+            return True
+        return self.__wait_done(rid, timeout)
 
+    #=======================================================
+    # Run tuner to a memory the tuner holds, uploaded by the tuner application
+    # Needs the binary encoding but no configuration, returns as set_memory()
+    # with status DONE_REJECTED if the tuner has no such memory. Memories are
+    # numbered in table order leaving out any too long to upload.
+    def recall_memory(self, memory_id, timeout = DONE_TIMEOUT):
+        if self.__encoding != protocol.ENC_BINARY:
+            print("Recall needs the binary encoding")
+            return False
+        rid = self.__next_rid()
+        if not self.__net_send_reliable([CMD_RECALL_MEMORY, [memory_id]], rid):
+            return False
+        return self.__wait_done(rid, timeout)
+    
+    #=======================================================
+    # Relay timing for set_memory() and recall_memory(), binary only
+    # The relays that go off break_ms before the new ones go on and the
+    # contacts get settle_ms before the tune completes. With overlap the
+    # capacitors move while the relays change.
+    def tune_settings(self, break_ms = TUNE_BREAK, settle_ms = TUNE_SETTLE, overlap = True):
+        if self.__encoding != protocol.ENC_BINARY:
+            print("Tune settings need the binary encoding")
+            return False
+        return self.__net_send_reliable([CMD_TUNE_SETTINGS, [break_ms, settle_ms, int(overlap)]])
+    
+    #=======================================================
+    # Stop both capacitors where they are
+    def stop(self):
+        self.__net_send_reliable([CMD_TX_SERVO_STOP, []])
+        self.__net_send_reliable([CMD_ANT_SERVO_STOP, []])
+        
+    #=======================================================
+    # Measure the link to the tuner, binary only
+    # Sends count pings and returns the rolling (rtt, clock offset) in
+    # seconds, or None if no pong has come back. The offset is the tuner
+    # clock less ours and maps EVNT_DONE times onto our monotonic clock.
+    def ping(self, count = 1, timeout = 1.0):
+        if self.__encoding != protocol.ENC_BINARY:
+            return None
+        for n in range(count):
+            t1 = ping.now_us()
+            # Never retried, a lost ping is just a lost sample
+            self.__net_send([CMD_PING, [t1]])
+            params = self.__wait_event(EVNT_PONG, t1, timeout)
+            if params != None:
+                delay, offset = self.__link.sample(params[0], params[1], params[2], ping.now_us())
+                # Also tunes the retransmit timer
+                self.__rtt.sample(delay / 1000000)
+        if self.__link.rtt() == None:
+            return None
+        return self.__link.rtt(), self.__link.offset()
+    
+    def rtt(self):
+        return self.__link.rtt()
+    
+    def clock_offset(self):
+        return self.__link.offset()
+        
+    #=======================================================
+    # Memory recalls are single larger moves
+    def __move_params(self, cap):
+        # Servers that only speak pickle predate move profiles
+        if self.__encoding == protocol.ENC_BINARY:
+            return [cap, MOVE_SCAN]
+        return [cap]
+        
     #======================================================= 
     # Net send
-    def __net_send(self, data):
-        self.__sock.sendto(pickle.dumps(data), (self.__model[CONFIG][RPi][IP], self.__model[CONFIG][RPi][RQST_PORT]))
+    def __net_send_batch(self, cmds):
+        # Returns the request id, 0 if none, None if not delivered
+        if self.__encoding == protocol.ENC_BINARY:
+            self.__batch_id = (self.__batch_id + 1) & 0xFFFF
+            rid = self.__next_rid()
+            if not self.__net_send_reliable([CMD_BATCH, [self.__batch_id, cmds]], rid):
+                return None
+            return rid
+        else:
+            # Server predates batches
+            for cmd in cmds:
+                self.__net_send(cmd)
+            return 0
+    
+    def __next_rid(self):
+        # Ids run 1 - 0xFFFF, 0 is no id
+        self.__rid = self.__rid % 0xFFFF + 1
+        return self.__rid
+    
+    def __net_send_reliable(self, data, rid = 0):
+        # Send and wait for the ack, retrying as needed. Returns False if never acked.
+        if self.__encoding != protocol.ENC_BINARY or data[0] in reliable.NO_RETRY:
+            self.__net_send(data, rid)
+            return True
+        self.__seq = self.__seq % 0xFFFF + 1
+        seq = self.__seq
+        retries = 0
+        while True:
+            sent = monotonic()
+            self.__net_send(data, rid, seq)
+            if self.__wait_event(EVNT_ACK, seq, self.__rtt.rto()) != None:
+                if retries == 0:
+                    self.__rtt.sample(monotonic() - sent)
+                return True
+            retries += 1
+            if retries > reliable.MAX_RETRIES:
+                print("No ack for %s, giving up" % data[0])
+                return False
+            self.__rtt.backoff()
+    
+    def __net_send(self, data, rid = 0, seq = 0):
+        encodedData = protocol.encode_command(data[0], data[1], self.__encoding, rid, seq, self.__session)
+        self.__sock.sendto(encodedData, self.__address)
+    
+    #=======================================================
+    # Net receive
+    def __wait_done(self, rid, timeout):
+        params = self.__done.pop(rid, None)
+        if params == None:
+            params = self.__wait_event(EVNT_DONE, rid, timeout)
+        if params == None:
+            print("No completion for memory request %d" % rid)
+            return None
+        status, tx, ant = params[1:4]
+        return status, tx, ant, params[6] / 1000000.0
+    
+    def __wait_event(self, wanted, key, timeout):
+        # Wait for an ack with seq key, a completion with rid key or a pong with
+        # client time key, returns its data or None
+        # Replies come back to the socket we sent from
+        end = monotonic() + timeout
+        while True:
+            remaining = end - monotonic()
+            if remaining <= 0:
+                return None
+            self.__sock.settimeout(remaining)
+            try:
+                data, address = self.__sock.recvfrom(512)
+            except socket.timeout:
+                continue
+            try:
+                evt, params, encoding = protocol.decode_event(data)
+            except protocol.ProtocolError as e:
+                print('Invalid event data [%s]' % str(e))
+                continue
+            if evt == EVNT_ACK:
+                if wanted == EVNT_ACK and params == key:
+                    return params
+            elif evt == EVNT_DONE:
+                if wanted == EVNT_DONE and params[0] == key:
+                    return params
+                # Keep it for __wait_done
+                self.__done[params[0]] = params
+            elif evt == EVNT_PONG:
+                if wanted == EVNT_PONG and params[0] == key:
+                    return params
     
 #======================================================================================================================
 # Test code
@@ -98,8 +310,10 @@ def main():
         api = Tuner_API()
         # Run application loop
         for n in range(0, 11):
-            api.set_memory(n)
-            sleep(5)
+            # Binary returns once the tuner has settled, pickle returns True
+            # as soon as it is sent so give the tuner time to get there
+            if api.set_memory(n) == True:
+                sleep(5)
        
     except Exception as e:
         print ('Exception [%s][%s]' % (str(e), traceback.format_exc()))
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+#
+# aio.py
+#
+# Copyright (C) 2021 by G3UKB Bob Cowdery
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#  The author can be reached by email at:
+#     bob@bobcowdery.plus.com
+#
+
+
+"""
+----------------------------------------------------------------------
+ asyncio core for the Remote Auto-Tuner server.
+
+ Replaces the NetIF, Heartbeat and Servo threads with a single event loop:
+    AsyncNetIF  -- DatagramProtocol feeding requests to the netif.Endpoint
+    heartbeat   -- task sending the heartbeat
+    motion      -- task running the servo MotionScheduler, woken when a
+                   command is posted or a step is due
+ Relay sequences are timed with the loop's call_later.
+ Nothing polls so requests are acted on as soon as they arrive and the
+ loop sleeps when there is nothing to do.
+----------------------------------------------------------------------
+"""
+
+# System imports
+import asyncio
+import socket
+from time import monotonic
+
+# Application imports
+from server_defs import *
+import netif
+
+"""
+Datagram protocol for requests
+"""
+class AsyncNetIF(asyncio.DatagramProtocol):
+    
+    def __init__(self, endpoint):
+        """
+        Constructor
+        
+        Arguments:
+            endpoint    --  the Endpoint to pass requests to
+            
+        """
+        
+        super(AsyncNetIF, self).__init__()
+        self.__endpoint = endpoint
+    
+    def connection_made(self, transport):
+        self.__endpoint.attach(transport.sendto)
+    
+    def datagram_received(self, data, address):
+        self.__endpoint.request(data, address)
+    
+    def error_received(self, exc):
+        print('Exception on request socket %s' % (str(exc)))
+
+#------------------------------------------------------------------
+async def heartbeat(endpoint):
+    """
+    Send heartbeats until cancelled
+    
+    Arguments:
+        endpoint    --  the Endpoint to send on
+    """
+    
+    while True:
+        endpoint.do_heartbeat()
+        await asyncio.sleep(HEARTBEAT_PERIOD)
+
+async def motion(scheduler):
+    """
+    Drive the servos until cancelled
+    
+    Arguments:
+        scheduler   --  the MotionScheduler to drive
+    """
+    
+    wakeup = asyncio.Event()
+    scheduler.set_wakeup(wakeup.set)
+    # Service once at the start for anything posted before we ran
+    wakeup.set()
+    delay = None
+    while True:
+        # Until the next step is due or a command is posted
+        try:
+            await asyncio.wait_for(wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
+        delay = scheduler.service(monotonic())
+
+async def serve(endpoint, scheduler, sequencer = None):
+    """
+    Run the server until cancelled
+    
+    Arguments:
+        endpoint    --  the Endpoint for requests and events
+        scheduler   --  the MotionScheduler to drive
+        sequencer   --  relays.Sequencer to time on the loop
+    """
+    
+    loop = asyncio.get_running_loop()
+    if sequencer != None:
+        sequencer.set_call_later(loop.call_later)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((netif.RQST_IP, netif.RQST_PORT))
+    transport, _ = await loop.create_datagram_endpoint(lambda: AsyncNetIF(endpoint), sock=sock)
+    try:
+        await asyncio.gather(heartbeat(endpoint), motion(scheduler))
+    finally:
+        transport.close()
+
+def run(endpoint, scheduler, sequencer = None):
+    """
+    Run the server, raises KeyboardInterrupt on exit
+    
+    Arguments:
+        endpoint    --  the Endpoint for requests and events
+        scheduler   --  the MotionScheduler to drive
+        sequencer   --  relays.Sequencer to time on the loop
+    """
+    
+    asyncio.run(serve(endpoint, scheduler, sequencer))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+#
+# bands.py
+#
+# Copyright (C) 2021 by G3UKB Bob Cowdery
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#  The author can be reached by email at:
+#     bob@bobcowdery.plus.com
+#
+
+"""
+----------------------------------------------------------------------
+ Inductor bands.
+
+ The inductor has a tap for each relay in the pin map. A band covers a
+ frequency range in MHz and gives the taps it energises as a bitmask,
+ bit n for pin map entry n, so the server only ever sees taps and any
+ number of bands can be configured. The table is held sorted on the
+ lower frequency and a frequency finds its band by bisection. Bands must
+ not overlap, a frequency in a gap between bands has no band.
+----------------------------------------------------------------------
+"""
+
+# System imports
+import bisect
+from collections import namedtuple
+
+# low, high in MHz, taps bitmask
+Band = namedtuple('Band', 'low high label taps')
+
+class BandTable:
+
+    def __init__(self, bands):
+        """
+        Constructor
+
+        Arguments:
+            bands   -- [(low, high, label, taps), ...] in any order
+
+        """
+
+        self.__bands = sorted([Band(*band) for band in bands])
+        self.__lows = [band.low for band in self.__bands]
+        self.__labels = {band.label: band for band in self.__bands}
+
+    def __len__(self):
+        return len(self.__bands)
+
+    def __iter__(self):
+        return iter(self.__bands)
+
+    #------------------------------------------------------------------
+    # PUBLIC
+
+    def lookup(self, freq):
+        """
+        The band covering a frequency or None
+
+        Arguments:
+            freq    -- frequency in MHz
+
+        """
+
+        index = bisect.bisect_right(self.__lows, freq) - 1
+        if index < 0 or freq > self.__bands[index].high:
+            return None
+        return self.__bands[index]
+
+    def band(self, label):
+        """ The band with a label or None """
+
+        return self.__labels.get(label)
+
+    def by_taps(self, taps):
+        """ The first band energising exactly these taps or None """
+
+        for band in self.__bands:
+            if band.taps == taps:
+                return band
+        return None
+
+    def resolve(self, label, freq):
+        """
+        The band for a memory, by label or failing that by frequency
+
+        Arguments:
+            label   -- band label as stored
+            freq    -- frequency in MHz as entered
+
+        """
+
+        band = self.band(label)
+        if band == None:
+            try:
+                band = self.lookup(float(freq))
+            except ValueError:
+                pass
+        return band
+
+#======================================================================================================================
+# Taps and pins
+def all_taps(count):
+    """ Bitmask with every one of count taps energised """
+
+    return (1 << count) - 1
+
+def tap_pins(pins, taps):
+    """
+    The pins energised for a taps bitmask
+
+    Arguments:
+        pins    -- pin map, [(pin, invert), ...]
+        taps    -- bitmask, bit n for pins[n]
+
+    """
+
+    return [pin for n, pin in enumerate(pins) if taps & (1 << n)]
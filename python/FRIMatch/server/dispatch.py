@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+#
+# dispatch.py
+#
+# Copyright (C) 2021 by G3UKB Bob Cowdery
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#  The author can be reached by email at:
+#     bob@bobcowdery.plus.com
+#
+
+"""
+----------------------------------------------------------------------
+ Command dispatch for the Remote Auto-Tuner server.
+
+ Each command is registered with a handler and the parameters it takes.
+ The parameter check is built once at registration and applied to every
+ request before its handler is called with the parameters unpacked.
+ A handler that finds it cannot act returns False, anything else is taken
+ as success.
+ New hardware registers its own commands, for the binary encoding it must
+ also give protocol.register_command() an opcode.
+----------------------------------------------------------------------
+"""
+
+# Any number of parameters but at least one
+VARIABLE = -1
+
+class Dispatcher:
+
+    def __init__(self):
+        """
+        Constructor
+
+        Arguments:
+
+        """
+
+        # cmd : (handler, check)
+        self.__table = {}
+        # cmd : [dispatched, rejected]
+        self.__counters = {}
+
+    #------------------------------------------------------------------
+    # PUBLIC
+
+    def register(self, cmd, handler, arity, types = None):
+        """
+        Register a command
+
+        Arguments:
+            cmd         -- command type
+            handler     -- callable taking the parameters as arguments, returns False to reject
+            arity       -- number of parameters, a tuple of allowed numbers or VARIABLE
+            types       -- optional tuple of types for the parameters in order
+
+        """
+
+        if cmd in self.__table:
+            raise ValueError('Command %s is already registered' % cmd)
+        self.__table[cmd] = (handler, _check(arity, types))
+        self.__counters[cmd] = [0, 0]
+
+    def is_registered(self, cmd):
+        return cmd in self.__table
+
+    def dispatch(self, cmd, params):
+        """
+        Check and execute a command
+
+        Arguments:
+            cmd         -- command type
+            params      -- command parameters
+
+        Returns True if the command was executed
+        """
+
+        if cmd not in self.__table:
+            print('Unknown request type %s!' % (cmd))
+            return False
+        handler, check = self.__table[cmd]
+        error = check(params)
+        if error != None:
+            self.__counters[cmd][1] += 1
+            print('Command %s %s' % (cmd, error))
+            return False
+        if check.unpack:
+            result = handler(*params)
+        else:
+            result = handler(params)
+        if result is False:
+            self.__counters[cmd][1] += 1
+            return False
+        self.__counters[cmd][0] += 1
+        return True
+
+    def check(self, cmd, params):
+        """
+        Check a command without executing it
+
+        Arguments:
+            cmd         -- command type
+            params      -- command parameters
+
+        Returns None if valid else the reason
+        """
+
+        if cmd not in self.__table:
+            return 'is unknown'
+        return self.__table[cmd][1](params)
+
+    def counters(self):
+        """ {cmd: [dispatched, rejected]} """
+
+        return {cmd: list(c) for cmd, c in self.__counters.items()}
+
+#======================================================================================================================
+# PRIVATE
+def _check(arity, types):
+    # Build the parameter check for a command
+
+    if arity == VARIABLE:
+        def check(params):
+            if not isinstance(params, (list, tuple)) or len(params) == 0:
+                return 'requires variable parameter list, received %d' % _count(params)
+            return None
+        # Handler gets the list
+        check.unpack = False
+        return check
+
+    if isinstance(arity, int):
+        allowed = (arity,)
+        text = 'requires %d parameters' % arity
+    else:
+        allowed = tuple(arity)
+        text = 'requires %s parameters' % ' or '.join([str(n) for n in allowed])
+
+    def check(params):
+        if not isinstance(params, (list, tuple)) or len(params) not in allowed:
+            return '%s, received %d' % (text, _count(params))
+        if types != None:
+            for n, (param, t) in enumerate(zip(params, types)):
+                if not isinstance(param, t):
+                    return 'parameter %d must be %s' % (n, _name(t))
+        return None
+    check.unpack = True
+    return check
+
+def _count(params):
+    try:
+        return len(params)
+    except TypeError:
+        return 1
+
+def _name(t):
+    if isinstance(t, tuple):
+        return ' or '.join([x.__name__ for x in t])
+    return t.__name__
@@ -23,42 +23,95 @@
 
 # System imports
 import os, sys
-from time import sleep
-import pickle
+from time import sleep, monotonic
 import subprocess
 import threading
 
 # Application imports
 from server_defs import *
 import netif
+import dispatch
+import protocol
+import pwm
 import servo
 import relays
+import memstore
+import state
+import aio
+import tune
+import bands
 
 """
     Main program for the Remote Auto_Tuner.
 """
 
+# Commands that complete when the servos come to rest
+MOTION_CMDS = (
+    CMD_TX_SERVO_TEST, CMD_TX_SERVO_HOME, CMD_TX_SERVO_MOVE, CMD_TX_SERVO_STOP,
+    CMD_ANT_SERVO_TEST, CMD_ANT_SERVO_HOME, CMD_ANT_SERVO_MOVE, CMD_ANT_SERVO_STOP,
+    CMD_SERVOS_MOVE, CMD_SERVOS_HOME, CMD_RESET,
+)
+# Commands that complete when their tune transaction does
+TUNE_CMDS = (CMD_TUNE, CMD_RECALL_MEMORY)
+
 class RemoteTuner:
     
-    def __init__(self):
-            
-        # Run the net interface as this is the active thread.
-        self.__netif = netif.NetIF(self.__netCallback)
-        self.__netif.start()
+    def __init__(self, use_asyncio = False):
+        """
+        Constructor
+        
+        Arguments:
+            use_asyncio -- run on an asyncio event loop rather than threads
+        """
+        
+        self.__use_asyncio = use_asyncio
+        
+        # Positions and relays from the last run
+        self.__state = state.TunerState()
         
-        # Create servos
-        self.__tx_servo = servo.Servo(0, self.__TxServoCallback)
-        self.__tx_servo.start()
-        self.__ant_servo = servo.Servo(1, self.__AntServoCallback)
-        self.__ant_servo.start()
+        # Requests and events
+        self.__dispatcher = dispatch.Dispatcher()
+        self.__endpoint = netif.Endpoint(self.__request)
         
-        # Create relays
+        # Create servos, both on one controller
+        self.__pwm = pwm.PWMDriver()
+        self.__tx_servo = servo.ServoChannel(0, self.__pwm)
+        self.__ant_servo = servo.ServoChannel(1, self.__pwm)
+        # Both run from one scheduler
+        self.__motion = servo.MotionScheduler((self.__tx_servo, self.__ant_servo), self.__pwm, self.__ServoCallback)
+        
+        # Create relays, timed sequences run off the network path
+        self.__sequencer = relays.Sequencer()
         self.__relays = relays.Relays()
-        self.__relays.init()
+        self.__relays.init(self.__sequencer)
+        
+        # Relays and servos together
+        self.__tuner = tune.TuneExecutor(self.__relays, self.__motion, self.__sequencer)
+        
+        # Memories uploaded by the client
+        self.__memories = memstore.MemoryStore()
         
-        # Heartbeat
-        self.__heartbeat = Heartbeat(self.__netif)
-        self.__heartbeat.start()
+        # Put the hardware back as it was, home if we don't know
+        if self.__state.known():
+            self.__restore()
+        else:
+            self.__motion.home()
+        
+        # Commands this server understands
+        self.__register_commands()
+        
+        if not self.__use_asyncio:
+            # Run the net interface as this is the active thread.
+            self.__netif = netif.NetIF(self.__endpoint)
+            self.__netif.start()
+            
+            # Servo driver
+            self.__motion_driver = servo.Motion(self.__motion)
+            self.__motion_driver.start()
+            
+            # Heartbeat
+            self.__heartbeat = Heartbeat(self.__endpoint)
+            self.__heartbeat.start()
         
     #------------------------------------------------------------------    
     def mainLoop(self):
@@ -68,6 +121,18 @@ class RemoteTuner:
         """
         
         print('Remote Auto-Tuner server running ...')
+        if self.__use_asyncio:
+            try:
+                # Runs until interrupted
+                aio.run(self.__endpoint, self.__motion, self.__sequencer)
+            except KeyboardInterrupt:
+                # Cleanup GPIO
+                self.__relays.close()
+                self.__state.close()
+                self.__memories.close()
+                print('Interrupt - exiting...')
+            return
+        
         try:
             # Main loop for ever
             while True:
@@ -83,154 +148,282 @@ class RemoteTuner:
             # Terminate the netif and servo threads and wait for thread exit
             self.__netif.terminate()
             self.__netif.join()
-            self.__tx_servo.terminate()
-            self.__tx_servo.join()
-            self.__ant_servo.terminate()
-            self.__ant_servo.join()
+            self.__motion_driver.terminate()
+            self.__motion_driver.join()
             self.__heartbeat.terminate()
             self.__heartbeat.join()
             
+            # Write any state or memory change still waiting
+            self.__state.close()
+            self.__memories.close()
+            
             print('Interrupt - exiting...')
     
-    #------------------------------------------------------------------        
-    def __netCallback(self, data):
+    #------------------------------------------------------------------
+    def register(self, cmd, handler, arity, types = None):
+        """
+        Register a command handler, see dispatch.Dispatcher.register()
+        
+        Arguments:
+            cmd         -- command type
+            handler     -- callable taking the parameters as arguments
+            arity       -- number of parameters, a tuple of allowed numbers or dispatch.VARIABLE
+            types       -- optional tuple of types for the parameters in order
+        """
+        
+        self.__dispatcher.register(cmd, handler, arity, types)
+    
+    #------------------------------------------------------------------
+    def __request(self, cmd, params, rid):
         
         """
         Callback from net interface
         
         Arguments:
-            data    -- the command data
+            cmd     -- the command type
+            params  -- the command parameters
+            rid     -- request id, 0 if no completion is wanted
         """
         
-        # Data arrived from caller
-        try:
-            cmd = pickle.loads(data)
-            # Command is an array of type followed by one or more parameters
-            rqst = cmd[0]
-            if rqst == CMD_WAKEUP:
-                # Nothing to do
-                pass
-            elif rqst == CMD_SERVO_SETTINGS:
-                if len(cmd[1]) != 4:
-                    print('Command %s requires 4 parameters, received %d' % (rqst, len(cmd[1])))
-                    return
-                self.__tx_servo.settings(cmd[1][0], cmd[1][1], cmd[1][2], cmd[1][3])
-                self.__ant_servo.settings(cmd[1][0], cmd[1][1], cmd[1][2], cmd[1][3])
-            elif rqst == CMD_TX_SERVO_SET_PWM:
-                if len(cmd[1]) != 2:
-                    print('Command %s requires 2 parameters, received %d' % (rqst, len(cmd[1])))
-                    return
-                self.__tx_servo.set_pwm_range(cmd[1][0], cmd[1][1])
-                
-            elif rqst == CMD_TX_SERVO_TEST:
-                if len(cmd[1]) != 0:
-                    print('Command %s requires 0 parameters, received %d' % (rqst, len(cmd[1])))
-                    return
-                self.__tx_servo.test_range()
-                
-            elif rqst == CMD_TX_SERVO_HOME:
-                if len(cmd[1]) != 0:
-                    print('Command %s requires 0 parameters, received %d' % (rqst, len(cmd[1])))
-                    return
-                self.__tx_servo.post((CMD_SERVO_HOME, ()))
-                
-            elif rqst == CMD_TX_SERVO_MOVE:
-                if len(cmd[1]) != 1:
-                    print('Command %s requires 1 parameters, received %d' % (rqst, len(cmd[1])))
-                    return
-                self.__tx_servo.post((CMD_SERVO_MOVE, (cmd[1][0])))
-            
-            elif rqst == CMD_ANT_SERVO_SET_PWM:
-                if len(cmd[1]) != 2:
-                    print('Command %s requires 2 parameters, received %d' % (rqst, len(cmd[1])))
-                    return
-                self.__ant_servo.set_pwm_range(cmd[1][0], cmd[1][1])
-                
-            elif rqst == CMD_ANT_SERVO_TEST:
-                if len(cmd[1]) != 0:
-                    print('Command %s requires 0 parameters, received %d' % (rqst, len(cmd[1])))
-                    return
-                self.__ant_servo.test_range()
-                
-            elif rqst == CMD_ANT_SERVO_HOME:
-                if len(cmd[1]) != 0:
-                    print('Command %s requires 0 parameters, received %d' % (rqst, len(cmd[1])))
-                    return
-                self.__ant_servo.post((CMD_SERVO_HOME, ()))
-                
-            elif rqst == CMD_ANT_SERVO_MOVE:
-                if len(cmd[1]) != 1:
-                    print('Command %s requires 1 parameters, received %d' % (rqst, len(cmd[1])))
-                    return
-                self.__ant_servo.post((CMD_SERVO_MOVE, (cmd[1][0])))
-                
-            elif rqst == CMD_RELAYS_INIT:
-                if len(cmd[1]) == 0:
-                    print('Command %s requires variable parameter list, received %d' % (rqst, len(cmd[1])))
-                    return
-                self.__relays.init_pins(cmd[1])
-            
-            elif rqst == CMD_RELAYS_SET:
-                if len(cmd[1]) == 0:
-                    print('Command %s requires variable parameter list, received %d' % (rqst, len(cmd[1])))
-                    return
-                self.__relays.set_pins(cmd[1])
-            
-            elif rqst == CMD_RELAYS_RESET:
-                if len(cmd[1]) == 0:
-                    print('Command %s requires variable parameter list, received %d' % (rqst, len(cmd[1])))
-                    return
-                self.__relays.reset_pins(cmd[1])
-                
-            elif rqst == CMD_RELAYS_CYCLE:
-                if len(cmd[1]) == 0:
-                    print('Command %s requires variable parameter list, received %d' % (rqst, len(cmd[1])))
-                    return
-                self.__relays.cycle_pins(cmd[1][0], cmd[1][1])
-                
-            elif rqst == CMD_RESET:
-                if len(cmd[1]) != 0:
-                    print('Command %s requires 0 parameters, received %d' % (rqst, len(cmd[1])))
-                    return
-                # Restart the net interface
-                self.__netif.terminate()
-                self.__netif.join()
-                sleep(1)
-                self.__netif = netif.NetIF(self.__netCallback)
-                self.__netif.start()
-                # Restart the servo
-                self.__device.terminate()
-                self.__servo = servo.Device()
-                self.__relays.close()
-                self.__relays = relay.Relay()
+        start = monotonic()
+        ok = self.__dispatcher.dispatch(cmd, params)
+        if rid == 0:
+            return
+        address = self.__endpoint.requester()
+        if ok and self.__tunes(cmd, params):
+            # One completion for relays and servos
+            def tuned(status, positions, now):
+                self.__endpoint.do_done(address, rid, status, positions, start, now)
+            self.__tuner.when_done(tuned)
+        elif ok and self.__moves(cmd, params):
+            # Complete when the servos come to rest
+            def done(positions, now):
+                self.__endpoint.do_done(address, rid, DONE_OK, positions, start, now)
+            self.__motion.when_settled(done)
+        else:
+            if ok:
+                status = DONE_OK
             else:
-                print('Unknown request type %s!' % (rqst))
-            
-        except pickle.UnpicklingError:
-            print('Failed to unpickle request data!')
-
-    #------------------------------------------------------------------        
-    def __TxServoCallback(self, data):
+                status = DONE_REJECTED
+            self.__endpoint.do_done(address, rid, status, self.__motion.positions(), start, monotonic())
+    
+    def __moves(self, cmd, params):
+        # True if the command sets servos in motion
+        return self.__contains(cmd, params, MOTION_CMDS)
+    
+    def __tunes(self, cmd, params):
+        # True if the command starts a tune transaction
+        return self.__contains(cmd, params, TUNE_CMDS)
+    
+    def __contains(self, cmd, params, cmds):
+        if cmd == CMD_BATCH:
+            for entry in params[1]:
+                if entry[0] in cmds:
+                    return True
+            return False
+        return cmd in cmds
+    
+    #------------------------------------------------------------------
+    def __register_commands(self):
         
         """
-        Callback from servo interface for progress reports
+        Register the built in commands
         
-        Arguments:
-            data    -- the progress data
         """
         
-        self.__netif.do_tx_progress(data) 
+        reg = self.__dispatcher.register
+        
+        # General
+        reg(CMD_WAKEUP,             self.__wakeup,          (0, 1))
+        reg(CMD_SERVO_SETTINGS,     self.__settings,        4, (int, int, int, int))
+        reg(CMD_SERVO_STATS,        self.__stats,           (0, 1))
+        reg(CMD_PING,               self.__endpoint.do_pong,        1, (int,))
+        reg(CMD_GET_STATE,          self.__get_state,       0)
+        reg(CMD_PROGRESS_RATE,      self.__motion.set_rate, 1, (int,))
+        reg(CMD_SUBSCRIBE,          self.__endpoint.subscribe,      2, (int, int))
+        reg(CMD_UNSUBSCRIBE,        self.__endpoint.unsubscribe,    1, (int,))
+        # TX servo
+        reg(CMD_TX_SERVO_SET_PWM,   lambda *p: self.__set_pwm(0, self.__tx_servo, *p),  2, (int, int))
+        reg(CMD_TX_SERVO_TEST,      self.__tx_servo.test_range,     0)
+        reg(CMD_TX_SERVO_HOME,      lambda: self.__tx_servo.post((CMD_SERVO_HOME, ())), 0)
+        reg(CMD_TX_SERVO_MOVE,      lambda *p: self.__move(self.__tx_servo, *p), (1, 2), (int, int))
+        reg(CMD_TX_SERVO_STOP,      lambda: self.__tx_servo.post((CMD_SERVO_STOP, ())), 0)
+        # Antenna servo
+        reg(CMD_ANT_SERVO_SET_PWM,  lambda *p: self.__set_pwm(1, self.__ant_servo, *p), 2, (int, int))
+        reg(CMD_ANT_SERVO_TEST,     self.__ant_servo.test_range,    0)
+        reg(CMD_ANT_SERVO_HOME,     lambda: self.__ant_servo.post((CMD_SERVO_HOME, ())), 0)
+        reg(CMD_ANT_SERVO_MOVE,     lambda *p: self.__move(self.__ant_servo, *p), (1, 2), (int, int))
+        reg(CMD_ANT_SERVO_STOP,     lambda: self.__ant_servo.post((CMD_SERVO_STOP, ())), 0)
+        # Both servos
+        reg(CMD_SERVOS_MOVE,        self.__servos_move,     (2, 3), (int, int, int))
+        reg(CMD_SERVOS_HOME,        self.__motion.home,     0)
+        # Relays
+        reg(CMD_RELAYS_INIT,        self.__relays_init,     dispatch.VARIABLE)
+        reg(CMD_RELAYS_SET,         self.__relays_set,      dispatch.VARIABLE)
+        reg(CMD_RELAYS_RESET,       self.__relays_reset,    dispatch.VARIABLE)
+        reg(CMD_RELAYS_CYCLE,       self.__relays_cycle,    2, ((list, tuple), str))
+        # Memories
+        reg(CMD_MEMORIES_INIT,      self.__memories.init,   2, ((list, tuple), int))
+        reg(CMD_MEMORY_STORE,       self.__memories.store,  6, (int, str, str, int, int, int))
+        reg(CMD_RECALL_MEMORY,      self.__recall,          1, (int,))
+        # Tune transactions
+        reg(CMD_TUNE,               self.__tune,            5, ((list, tuple), int, int, int, int))
+        reg(CMD_TUNE_SETTINGS,      self.__tuner.settings,  3, (int, int, int))
+        # Batches and reset
+        reg(CMD_BATCH,              self.__batch,           2, (int, (list, tuple)))
+        reg(CMD_RESET,              self.__reset,           0)
+    
+    #------------------------------------------------------------------
+    # Command handlers
+    def __wakeup(self, version = None):
+        # Nothing to do, the Endpoint has negotiated the encoding
+        pass
+    
+    def __settings(self, track_inc, track_delay, scan_inc, scan_delay):
+        self.__tx_servo.settings(track_inc, track_delay, scan_inc, scan_delay)
+        self.__ant_servo.settings(track_inc, track_delay, scan_inc, scan_delay)
+    
+    def __stats(self, clear = 0):
+        self.__endpoint.do_stats(0, self.__tx_servo.stats(bool(clear)))
+        self.__endpoint.do_stats(1, self.__ant_servo.stats(bool(clear)))
+    
+    def __get_state(self):
+        taps = self.__state.snapshot()[3]
+        self.__endpoint.do_state(self.__motion.positions(), self.__motion.commanded(), taps)
     
-    def __AntServoCallback(self, data):
+    def __set_pwm(self, index, channel, low, high):
+        channel.set_pwm_range(low, high)
+        self.__state.pwm_range(index, low, high)
+    
+    def __relays_init(self, pins):
+        # Clients initialise their whole pin map
+        self.__tuner.supersede()
+        self.__relays.init_pins(pins)
+        self.__save_relays(pins, True)
+    
+    def __relays_set(self, pins):
+        self.__tuner.supersede()
+        self.__relays.set_pins(pins)
+        self.__save_relays(pins)
+    
+    def __relays_reset(self, pins):
+        self.__tuner.supersede()
+        self.__relays.reset_pins(pins)
+        self.__save_relays(pins)
+    
+    def __relays_cycle(self, pins, mode):
+        # A cycle leaves every relay off
+        self.__tuner.supersede()
+        self.__relays.cycle_pins(pins, mode)
+        self.__save_relays(pins)
+    
+    def __save_relays(self, pins, pin_map = False):
+        # Taps over the pin map from the relays actually energised, pins are
+        # the whole map if pin_map else added to the map we know
+        if pin_map:
+            known = []
+        else:
+            known = self.__state.snapshot()[4]
+        numbers = [pin[0] for pin in known]
+        for pin in pins:
+            if pin[0] not in numbers:
+                known.append(tuple(pin))
+                numbers.append(pin[0])
+        energised = self.__relays.energised()
+        taps = 0
+        for n, pin in enumerate(numbers):
+            if energised & (1 << int(pin)):
+                taps |= 1 << n
+        self.__state.relays(taps, known)
+    
+    def __move(self, channel, angle, mode = MOVE_TRACK):
+        # Older clients send no profile
+        channel.post((CMD_SERVO_MOVE, (angle, mode)))
+    
+    def __servos_move(self, tx, ant, mode = MOVE_TRACK):
+        self.__motion.move((tx, ant), mode)
+    
+    def __recall(self, memory_id):
+        # Everything was worked out when the memory was stored
+        memory = self.__memories.recall(memory_id)
+        if memory == None:
+            print('No memory %d' % memory_id)
+            return False
+        pins, taps, tx, ant = memory
+        self.__start_tune(pins, taps, (tx, ant), MOVE_SCAN)
+    
+    def __tune(self, pins, taps, tx, ant, mode):
+        angles = [None if angle == MEMORY_NO_ANGLE else angle for angle in (tx, ant)]
+        self.__start_tune(pins, taps, angles, mode)
+    
+    def __start_tune(self, pins, taps, angles, mode):
+        # Relays break before make, capacitors move alongside
+        if taps == TAPS_UNKNOWN:
+            # Leave the relays alone
+            energise = None
+        else:
+            energise = bands.tap_pins(pins, taps)
+            self.__relays.init_pins(pins)
+            self.__state.relays(taps, pins)
+        self.__tuner.tune(energise, angles, mode)
+    
+    def __batch(self, batch_id, cmds):
+        # Vet the whole batch before executing any of it
+        try:
+            for cmd in cmds:
+                if cmd[0] == CMD_BATCH:
+                    raise protocol.ProtocolError('Batches cannot be nested')
+                if self.__dispatcher.is_registered(cmd[0]):
+                    error = self.__dispatcher.check(cmd[0], cmd[1])
+                    if error != None:
+                        raise protocol.ProtocolError('%s %s' % (cmd[0], error))
+                protocol.check_command(cmd[0], cmd[1])
+        except (protocol.ProtocolError, TypeError, IndexError) as e:
+            print('Batch %s rejected [%s]' % (str(batch_id), str(e)))
+            return False
+        # Handlers may still refuse, e.g. an unknown memory
+        executed = 0
+        for cmd in cmds:
+            if self.__dispatcher.dispatch(cmd[0], cmd[1]):
+                executed += 1
+        self.__endpoint.do_batch_done(batch_id, executed)
+    
+    def __reset(self):
+        # Put the hardware back to its initial state
+        self.__tuner.supersede()
+        self.__relays.close()
+        self.__relays = relays.Relays()
+        self.__relays.init(self.__sequencer)
+        self.__tuner.set_relays(self.__relays)
+        self.__state.relays(TAPS_UNKNOWN, [])
+        self.__motion.home()
+    
+    def __restore(self):
+        # As the last run left things
+        settled, commanded, ranges, taps, pins = self.__state.snapshot()
+        for channel, pwm_range in zip((self.__tx_servo, self.__ant_servo), ranges):
+            if pwm_range != None:
+                channel.set_pwm_range(*pwm_range)
+        self.__motion.restore(settled)
+        if len(pins) > 0:
+            self.__relays.init_pins(pins)
+            if taps != TAPS_UNKNOWN:
+                self.__relays.set_pins(bands.tap_pins(pins, taps))
+
+    #------------------------------------------------------------------        
+    def __ServoCallback(self, positions, settled):
         
         """
         Callback from servo interface for progress reports
         
         Arguments:
-            data    -- the progress data
+            positions   -- (tx, ant) positions
+            settled     -- True if the servos have come to rest
         """
         
-        self.__netif.do_ant_progress(data)
+        self.__endpoint.do_progress(positions[0], positions[1])
+        if settled:
+            self.__state.settled(positions, self.__motion.commanded())
  
 #======================================================================================================================
 # Monitor thread
@@ -241,7 +434,7 @@ class Heartbeat(threading.Thread):
         Constructor
         
         Arguments:
-            net_if        -- net interface instance
+            net_if        -- net interface Endpoint
         """
         
         super(Heartbeat, self).__init__()#
@@ -257,11 +450,12 @@ class Heartbeat(threading.Thread):
         
         while not self.__terminate:
             self.__net_if.do_heartbeat()
-            sleep(0.5)
+            sleep(HEARTBEAT_PERIOD)
                        
 # ===========================================================================                
 # Entry point            
 if __name__ == '__main__':
-    main = RemoteTuner()
+    # python3 main.py [--asyncio]
+    main = RemoteTuner('--asyncio' in sys.argv[1:])
     main.mainLoop()        
     
\ No newline at end of file
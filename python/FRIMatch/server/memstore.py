@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+#
+# memstore.py
+#
+# Copyright (C) 2021 by G3UKB Bob Cowdery
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#  The author can be reached by email at:
+#     bob@bobcowdery.plus.com
+#
+
+"""
+----------------------------------------------------------------------
+ Memories held by the server.
+
+ The client uploads its memory table with CMD_MEMORIES_INIT, giving the
+ relay pin map and the number of memories, then CMD_MEMORY_STORE for each
+ memory. Each command stands alone so they may arrive in any order or be
+ repeated. Each memory is worked out once into the taps and the
+ angles it needs, so CMD_RECALL_MEMORY is a lookup. The table is saved
+ a little after it changes, so an upload is written once, and reloaded
+ when the server starts.
+----------------------------------------------------------------------
+"""
+
+# System imports
+import threading
+
+# Application imports
+from server_defs import *
+import state
+
+class MemoryStore:
+
+    def __init__(self, path = MEMORY_STORE_PATH):
+        """
+        Constructor
+
+        Arguments:
+            path    -- file to keep the table in
+
+        """
+
+        self.__path = path
+        # Relay pin map, [(pin, invert), ...]
+        self.__pins = []
+        # Number of memories
+        self.__count = 0
+        # As uploaded, id : [name, freq, taps, tx, ant]
+        self.__memories = {}
+        # Ready to execute, id : (taps, tx or None, ant or None)
+        self.__recall = {}
+        self.__lock = threading.Lock()
+        self.__saver = state.DeferredSave(path, self.__copy)
+
+        self.__load()
+
+    #------------------------------------------------------------------
+    # PUBLIC
+
+    def init(self, pins, count):
+        """
+        Start of an upload
+
+        Arguments:
+            pins    -- relay pin map, [(pin, invert), ...]
+            count   -- number of memories, higher ids are removed
+
+        """
+
+        pins = [(int(pin), bool(inv)) for pin, inv in pins]
+        with self.__lock:
+            changed = pins != self.__pins or count != self.__count
+            self.__pins = pins
+            self.__count = min(count, MAX_MEMORIES)
+            for memory_id in [m for m in self.__memories if m >= self.__count]:
+                del self.__memories[memory_id]
+                del self.__recall[memory_id]
+        if changed:
+            self.__saver.changed()
+
+    def store(self, memory_id, name, freq, taps, tx, ant):
+        """
+        Add or replace a memory
+
+        Arguments:
+            memory_id   -- 0 to count - 1
+            name        -- memory name
+            freq        -- frequency as entered
+            taps        -- inductor taps as a bitmask over the pins or TAPS_UNKNOWN
+            tx          -- tx capacitor angle or MEMORY_NO_ANGLE
+            ant         -- antenna capacitor angle or MEMORY_NO_ANGLE
+
+        Returns False if the id is outside the table
+        """
+
+        with self.__lock:
+            if memory_id >= self.__count:
+                print('Memory %d outside table of %d' % (memory_id, self.__count))
+                return False
+            entry = [name, freq, taps, tx, ant]
+            if self.__memories.get(memory_id) == entry:
+                # Uploads repeat on every connect
+                return True
+            self.__memories[memory_id] = entry
+            self.__recall[memory_id] = _compile(entry)
+        self.__saver.changed()
+        return True
+
+    def recall(self, memory_id):
+        """
+        Look up a memory
+
+        Arguments:
+            memory_id   -- memory to recall
+
+        Returns (pins, taps, tx or None, ant or None) or None
+        """
+
+        with self.__lock:
+            if memory_id not in self.__recall:
+                return None
+            return (self.__pins,) + self.__recall[memory_id]
+
+    def count(self):
+        return self.__count
+
+    def close(self):
+        """ Write any change still waiting, at shut down """
+
+        self.__saver.close()
+
+    #------------------------------------------------------------------
+    # PRIVATE
+
+    def __load(self):
+
+        saved = state.load(self.__path)
+        if saved == None:
+            return
+        self.__pins = saved['pins']
+        self.__count = saved['count']
+        # Tables from before taps are replaced on the next upload
+        self.__memories = {m: entry for m, entry in saved['memories'].items() if isinstance(entry[2], int)}
+        self.__recall = {m: _compile(entry) for m, entry in self.__memories.items()}
+
+    def __copy(self):
+
+        with self.__lock:
+            return {'pins': list(self.__pins), 'count': self.__count, 'memories': dict(self.__memories)}
+
+#======================================================================================================================
+# PRIVATE
+def _compile(entry):
+    # Memory as (taps, tx, ant)
+    name, freq, taps, tx, ant = entry
+    return taps, _angle(tx), _angle(ant)
+
+def _angle(angle):
+    if angle < 0 or angle > 180:
+        return None
+    return angle
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+#
+# motion.py
+#
+# Copyright (C) 2021 by G3UKB Bob Cowdery
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#  The author can be reached by email at:
+#     bob@bobcowdery.plus.com
+#
+
+
+"""
+----------------------------------------------------------------------
+ Motion profiles for the capacitor servos.
+
+ A servo can't be slowed down so speed is set by how far it is moved
+ each tick. Moves follow a trapezoidal velocity profile: the step grows
+ by 'inc' degrees each tick up to a maximum, cruises, then shrinks again
+ so the servo arrives at the minimum step. Short moves never leave the
+ minimum step so fine adjustments stay smooth, long moves cover most of
+ the distance at full step.
+
+ The profile is worked out a tick at a time from the distance left and
+ the current step so a move can be retargeted at any point.
+----------------------------------------------------------------------
+"""
+
+# Application imports
+from server_defs import *
+
+class Profile:
+    
+    def __init__(self, inc, delay, max_mult):
+        """
+        Constructor
+        
+        Arguments:
+            inc         -- minimum step and acceleration in degrees per tick
+            delay       -- tick period in ms
+            max_mult    -- maximum step as a multiple of inc
+            
+        """
+        
+        self.__inc = max(1, int(inc))
+        self.__period = max(1.0, float(delay)) / 1000.0
+        self.__max_mult = max(1, int(max_mult))
+        self.__max_step = self.__inc * self.__max_mult
+    
+    def period(self):
+        """ Seconds between ticks """
+        
+        return self.__period
+    
+    def stretched(self, period):
+        """
+        The same profile ticking more slowly
+        
+        Arguments:
+            period      -- seconds between ticks, not less than this profile's
+        
+        """
+        
+        return Profile(self.__inc, max(self.__period, period) * 1000.0, self.__max_mult)
+    
+    def ticks(self, distance):
+        """
+        Ticks a move takes from rest
+        
+        Arguments:
+            distance    -- degrees to move
+        
+        """
+        
+        n = 0
+        step = 0
+        while distance > 0:
+            step = self.next_step(distance, step)
+            distance -= step
+            n += 1
+        return n
+    
+    def stopping(self, step):
+        """
+        Degrees needed to come to rest from a step, slowing along the profile
+        
+        Arguments:
+            step        -- size of the last step, 0 if at rest
+        
+        """
+        
+        return self.__braking(step)
+    
+    def next_step(self, remaining, step):
+        """
+        Size of the next step
+        
+        Arguments:
+            remaining   -- degrees still to go (> 0)
+            step        -- size of the last step, 0 if starting from rest
+        
+        Returns the step in degrees, never more than remaining
+        
+        """
+        
+        inc = self.__inc
+        # Largest of accelerate, cruise or decelerate that can still stop in time
+        for candidate in (step + inc, step, step - inc):
+            if candidate < inc or candidate > self.__max_step:
+                continue
+            if remaining - candidate >= self.__braking(candidate):
+                return candidate
+        # Can't stop in time (retargeted short), slow as hard as allowed
+        return min(remaining, max(inc, step - inc))
+    
+    def __braking(self, step):
+        # Distance covered slowing from step to inc, excluding the step itself
+        n = step // self.__inc
+        return self.__inc * n * (n - 1) // 2
+
+"""
+Step timing statistics for one servo.
+Steps are scheduled against absolute deadlines so lateness doesn't
+accumulate. Each step records how late it was taken; a step more than a
+whole period late is an overrun and the schedule is restarted from then
+rather than bursting to catch up.
+"""
+class StepStats:
+    
+    def __init__(self):
+        """
+        Constructor
+        
+        Arguments:
+            
+        """
+        
+        self.clear()
+        
+    def clear(self):
+        """ Zero all counters """
+        
+        # Totals since start or last clear
+        self.__moves = 0
+        self.__steps = 0
+        self.__overruns = 0
+        self.__worst = 0.0
+        # The last completed move
+        self.__last = (0, 0, 0.0, 0.0)
+        # The move in progress
+        self.__in_move = False
+        self.__move_steps = 0
+        self.__move_overruns = 0
+        self.__move_worst = 0.0
+        self.__move_total = 0.0
+    
+    def begin(self):
+        """ A move is starting from rest """
+        
+        self.__in_move = True
+        self.__move_steps = 0
+        self.__move_overruns = 0
+        self.__move_worst = 0.0
+        self.__move_total = 0.0
+    
+    def step(self, late, overrun):
+        """
+        Record a step
+        
+        Arguments:
+            late        -- seconds after its deadline the step was taken
+            overrun     -- True if a whole period or more was missed
+            
+        """
+        
+        self.__steps += 1
+        self.__move_steps += 1
+        self.__move_total += late
+        if late > self.__move_worst:
+            self.__move_worst = late
+        if late > self.__worst:
+            self.__worst = late
+        if overrun:
+            self.__overruns += 1
+            self.__move_overruns += 1
+    
+    def end(self):
+        """ The move has arrived or been abandoned """
+        
+        if not self.__in_move:
+            return
+        self.__in_move = False
+        self.__moves += 1
+        mean = 0.0
+        if self.__move_steps > 0:
+            mean = self.__move_total / self.__move_steps
+        self.__last = (self.__move_steps, self.__move_overruns, self.__move_worst, mean)
+    
+    def snapshot(self):
+        """
+        Current counters as
+            [moves, steps, overruns, worst us,
+             last move steps, last move overruns, last move worst us, last move mean us]
+        """
+        
+        steps, overruns, worst, mean = self.__last
+        return [self.__moves, self.__steps, self.__overruns, _us(self.__worst),
+                steps, overruns, _us(worst), _us(mean)]
+
+def _us(seconds):
+    return int(round(seconds * 1000000))
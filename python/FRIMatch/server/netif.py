@@ -24,9 +24,11 @@
 import os, sys
 import threading
 import socket
-import pickle
+from time import monotonic
 
 from server_defs import *
+import protocol
+import reliable
 
 # Net interface
 RQST_IP = ''
@@ -35,33 +37,158 @@ EVNT_PORT = 10003
 
 """
 Interface to the Remote Auto-Tuner client application:
+    Endpoint    -- decodes requests and sends events, knows nothing about how
+                   datagrams are moved
+    NetIF       -- thread moving datagrams to/from the Endpoint
+The asyncio equivalent of NetIF is in aio.py.
+
+Events go to every subscriber whose mask includes them. Any request
+subscribes its host to all events on EVNT_PORT so older clients work as
+before; these implicit subscriptions last until the host subscribes or
+unsubscribes itself or has sent nothing for IMPLICIT_TIMEOUT, and the one
+heard from least recently makes way for a new subscriber when the table is
+full. CMD_SUBSCRIBE chooses the events and port and must be renewed within
+SUBSCRIBE_TIMEOUT. Replies to a request go straight back to the address it
+came from. Encodings are negotiated per requesting address and each
+subscriber gets events in the encoding of the address that subscribed it,
+so clients sharing a host may use different encodings.
 """
 
-class NetIF(threading.Thread):
+class Endpoint:
     
     def __init__(self, callback):
         """
         Constructor
         
         Arguments:
-            callback    --  callback here when data arrives
+            callback    --  callback here with (cmd, params, rid) when a request arrives
             
         """
 
-        super(NetIF, self).__init__()
         self.__callback = callback
         
-        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.__sock.bind((RQST_IP, RQST_PORT))
-        self.__sock.settimeout(3)
+        # Set by the transport
+        self.__sendto = None
         
-        self.__address = None
-        self.__terminate = False
+        # Subscribers, (host, port) : [mask, expiry, requester, encoding, implicit]
+        self.__subscribers = {}
+        # Negotiated encoding, requester address : encoding, least recently heard first
+        self.__encodings = {}
+        # Address of the request being executed and when it arrived
+        self.__requester = None
+        self.__arrival = 0
+        # Recent sequence numbers, address : reliable.SeqWindow
+        self.__windows = {}
+        # Requests and events run on different threads
+        self.__lock = threading.Lock()
     
-    def terminate(self):
-        """ Terminate thread """
+    def attach(self, sendto):
+        """
+        Attach the transport
         
-        self.__terminate = True
+        Arguments:
+            sendto  --  callable(data, address) to send a datagram
+        
+        """
+        
+        self.__sendto = sendto
+    
+    def request(self, data, address):
+        """
+        A request datagram has arrived
+        
+        Arguments:
+            data    --  the datagram
+            address --  address of the sender
+        
+        """
+        
+        arrival = monotonic()
+        try:
+            cmd, params, encoding, rid, seq, session = protocol.decode_command(data)
+        except protocol.ProtocolError as e:
+            print('Invalid request data [%s]' % str(e))
+            return
+        if seq != 0:
+            # Ack before anything else so the sender's RTT is just the network
+            self.__reply(address, 'ack', EVNT_ACK, seq, protocol.ENC_BINARY)
+            with self.__lock:
+                if address not in self.__windows:
+                    if len(self.__windows) >= MAX_SUBSCRIBERS:
+                        # Forget the oldest sender
+                        del self.__windows[next(iter(self.__windows))]
+                    self.__windows[address] = reliable.SeqWindow()
+                duplicate = self.__windows[address].seen(seq, session)
+            if duplicate:
+                return
+        host = address[0]
+        with self.__lock:
+            # Answer in whatever the client negotiated
+            current = self.__encodings.pop(address, protocol.ENC_PICKLE)
+            if len(self.__encodings) >= MAX_SUBSCRIBERS:
+                # Forget the requester heard from least recently
+                del self.__encodings[next(iter(self.__encodings))]
+            encoding = protocol.event_encoding(cmd, params, encoding, current)
+            self.__encodings[address] = encoding
+            for entry in self.__subscribers.values():
+                if entry[2] == address:
+                    entry[3] = encoding
+            implicit = self.__subscribers.get((host, EVNT_PORT))
+            if implicit != None and implicit[4]:
+                # Still there
+                implicit[1] = arrival + IMPLICIT_TIMEOUT
+            elif not self.__subscribed(host):
+                self.__add(host, EVNT_PORT, SUB_ALL, arrival + IMPLICIT_TIMEOUT, address, True)
+        self.__requester = address
+        self.__arrival = arrival
+        try:
+            self.__callback(cmd, params, rid)
+        finally:
+            self.__requester = None
+    
+    def requester(self):
+        """ Address of the request being executed, for replies sent later """
+        
+        return self.__requester
+    
+    def subscribe(self, mask, port):
+        """
+        Subscribe the requesting host to events
+        
+        Arguments:
+            mask    --  SUB_* bits for the events wanted
+            port    --  port to send them to, 0 for EVNT_PORT
+        
+        """
+        
+        if self.__requester == None:
+            return
+        host = self.__requester[0]
+        if port == 0:
+            port = EVNT_PORT
+        with self.__lock:
+            # Replaces the implicit subscription
+            if (host, EVNT_PORT) in self.__subscribers and self.__subscribers[(host, EVNT_PORT)][4]:
+                del self.__subscribers[(host, EVNT_PORT)]
+            self.__add(host, port, mask, monotonic() + SUBSCRIBE_TIMEOUT, self.__requester, False)
+    
+    def unsubscribe(self, port):
+        """
+        Unsubscribe the requesting host
+        
+        Arguments:
+            port    --  port given when subscribing, 0 for EVNT_PORT
+        
+        """
+        
+        if self.__requester == None:
+            return
+        host = self.__requester[0]
+        if port == 0:
+            port = EVNT_PORT
+        with self.__lock:
+            if (host, port) in self.__subscribers:
+                del self.__subscribers[(host, port)]
     
     def do_heartbeat(self):
         """
@@ -71,55 +198,198 @@ class NetIF(threading.Thread):
            
         """
         
-        if self.__address != None:
-            try:
-                pickledData = pickle.dumps(('heartbeat', ()))
-                self.__sock.sendto(pickledData, (self.__address[0], EVNT_PORT))
-                
-            except Exception as e:
-                print('Exception on heartbeat send %s' % (str(e)))
+        self.__send(SUB_HEARTBEAT, 'heartbeat', [(EVNT_HEARTBEAT, ())])
 
-    def do_tx_progress(self, data):
+    def do_progress(self, tx, ant):
         """
-        Send progress data
+        Send both servo positions
         
         Arguments:
-            data    --  opaque data to send
+            tx      --  TX servo position
+            ant     --  antenna servo position
         
         """
         
-        if self.__address != None:
-            try:
-                pickledData = pickle.dumps(('tx', data))
-                self.__sock.sendto(pickledData, (self.__address[0], EVNT_PORT))
-                
-            except Exception as e:
-                print('Exception on tx progress send %s' % (str(e)))
+        # Older clients know only the separate events
+        self.__send(SUB_PROGRESS, 'progress', [(EVNT_POS, (tx, ant))],
+                    [(EVNT_TX, tx), (EVNT_ANT, ant)])
     
-    def do_ant_progress(self, data):
+    def do_batch_done(self, batch_id, count):
         """
-        Send progress data
+        Send batch completion to the requester
         
         Arguments:
-            data    --  opaque data to send
+            batch_id    --  id the client gave the batch
+            count       --  number of commands executed
         
         """
         
-        if self.__address != None:
+        self.__reply(self.__requester, 'batch completion', EVNT_BATCH, (batch_id, count))
+    
+    def do_stats(self, channel, stats):
+        """
+        Send servo step timing counters to the requester
+        
+        Arguments:
+            channel     --  servo channel the counters are for
+            stats       --  counters from ServoChannel.stats()
+        
+        """
+        
+        self.__reply(self.__requester, 'servo stats', EVNT_STATS, [channel] + stats)
+    
+    def do_pong(self, t1):
+        """
+        Answer CMD_PING
+        
+        Arguments:
+            t1          --  client time the ping was sent, us
+        
+        """
+        
+        t2 = int(self.__arrival * 1000000)
+        self.__reply(self.__requester, 'pong', EVNT_PONG, (t1, t2, int(monotonic() * 1000000)))
+    
+    def do_state(self, positions, commanded, taps):
+        """
+        Answer CMD_GET_STATE
+        
+        Arguments:
+            positions   --  (tx, ant) positions now
+            commanded   --  (tx, ant) positions last commanded
+            taps        --  inductor taps energised or TAPS_UNKNOWN
+        
+        """
+        
+        self.__reply(self.__requester, 'state', EVNT_STATE,
+                     (positions[0], positions[1], commanded[0], commanded[1], taps))
+    
+    def do_done(self, address, rid, status, positions, start, end):
+        """
+        Send request completion
+        
+        Arguments:
+            address     --  requester() when the request arrived
+            rid         --  request id
+            status      --  DONE_OK | DONE_REJECTED
+            positions   --  (tx, ant) positions at completion
+            start       --  monotonic time the request arrived
+            end         --  monotonic time it completed
+        
+        """
+        
+        start_us = int(start * 1000000)
+        end_us = int(end * 1000000)
+        self.__reply(address, 'completion', EVNT_DONE,
+                     (rid, status, positions[0], positions[1], start_us, end_us, end_us - start_us))
+    
+    def __subscribed(self, host):
+        
+        for h, port in self.__subscribers:
+            if h == host:
+                return True
+        return False
+    
+    def __add(self, host, port, mask, expiry, requester, implicit):
+        
+        if (host, port) not in self.__subscribers and len(self.__subscribers) >= MAX_SUBSCRIBERS:
+            self.__expire(monotonic())
+        if (host, port) not in self.__subscribers and len(self.__subscribers) >= MAX_SUBSCRIBERS:
+            # Make way by dropping the implicit subscriber heard from least recently
+            implicit = [(entry[1], address) for address, entry in self.__subscribers.items() if entry[4]]
+            if len(implicit) == 0:
+                print('Too many subscribers, ignoring %s:%d' % (host, port))
+                return
+            del self.__subscribers[min(implicit)[1]]
+        encoding = self.__encodings.get(requester, protocol.ENC_PICKLE)
+        self.__subscribers[(host, port)] = [mask, expiry, requester, encoding, implicit]
+    
+    def __expire(self, now):
+        
+        for address in list(self.__subscribers):
+            if self.__subscribers[address][1] < now:
+                del self.__subscribers[address]
+    
+    def __reply(self, address, what, evt, data, encoding = None):
+        
+        if address == None or self.__sendto == None:
+            return
+        if encoding == None:
+            with self.__lock:
+                encoding = self.__encodings.get(address, protocol.ENC_PICKLE)
+        try:
+            self.__sendto(protocol.encode_event(evt, data, encoding), address)
+        except Exception as e:
+            print('Exception on %s send %s' % (what, str(e)))
+    
+    def __send(self, kind, what, events, pickle_events = None):
+        """
+        Send events to the subscribers that want them
+        
+        Arguments:
+            kind            --  SUB_* bit for the events
+            what            --  description for errors
+            events          --  [(evt, data), ...] to send
+            pickle_events   --  events for pickle clients if different
+        
+        """
+        
+        if self.__sendto == None:
+            return
+        now = monotonic()
+        with self.__lock:
+            self.__expire(now)
+            targets = []
+            for address, (mask, expiry, requester, encoding, implicit) in self.__subscribers.items():
+                if mask & kind:
+                    targets.append((address, encoding))
+        # Encode once for each encoding in use
+        encoded = {}
+        for address, encoding in targets:
             try:
-                pickledData = pickle.dumps(('ant', data))
-                self.__sock.sendto(pickledData, (self.__address[0], EVNT_PORT))
+                if encoding not in encoded:
+                    evts = events
+                    if encoding == protocol.ENC_PICKLE and pickle_events != None:
+                        evts = pickle_events
+                    encoded[encoding] = [protocol.encode_event(evt, data, encoding) for evt, data in evts]
+                for data in encoded[encoding]:
+                    self.__sendto(data, address)
                 
             except Exception as e:
-                print('Exception on antenna progress send %s' % (str(e)))
+                print('Exception on %s send %s' % (what, str(e)))
+
+class NetIF(threading.Thread):
+    
+    def __init__(self, endpoint):
+        """
+        Constructor
+        
+        Arguments:
+            endpoint    --  the Endpoint to pass requests to
+            
+        """
+
+        super(NetIF, self).__init__()
+        self.__endpoint = endpoint
+        
+        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__sock.bind((RQST_IP, RQST_PORT))
+        self.__sock.settimeout(3)
+        self.__endpoint.attach(self.__sock.sendto)
+        
+        self.__terminate = False
+    
+    def terminate(self):
+        """ Terminate thread """
+        
+        self.__terminate = True
 
     def run(self):
         """ Listen for requests """
         
         while not self.__terminate:
             try:
-                data, self.__address = self.__sock.recvfrom(512)
-                self.__callback(data)
+                data, address = self.__sock.recvfrom(protocol.MAX_REQUEST)
+                self.__endpoint.request(data, address)
             except socket.timeout:
                 continue
-            
\ No newline at end of file
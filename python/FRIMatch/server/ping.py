@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+#
+# ping.py
+#
+# Copyright (C) 2021 by G3UKB Bob Cowdery
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#  The author can be reached by email at:
+#     bob@bobcowdery.plus.com
+#
+
+"""
+----------------------------------------------------------------------
+ Link latency and clock offset.
+
+ The client sends CMD_PING with its send time t1 and the server answers
+ EVNT_PONG with t1, the time the ping arrived t2 and the time the pong
+ left t3. With t4 the time the pong arrived back, as NTP:
+
+    delay  = (t4 - t1) - (t3 - t2)
+    offset = ((t2 - t1) + (t3 - t4)) / 2
+
+ All times are integer us from each end's monotonic clock so the offset
+ maps server timestamps, e.g. in EVNT_DONE, onto the client clock. The
+ offset is taken from the sample with the least delay in the window as
+ that one had the least queueing to make the path asymmetric.
+----------------------------------------------------------------------
+"""
+
+# System imports
+from collections import deque
+from time import monotonic
+
+# Samples kept
+PING_WINDOW = 8
+
+def now_us():
+    """ Local monotonic clock in us as sent in CMD_PING """
+
+    return int(monotonic() * 1000000)
+
+class LinkEstimator:
+
+    def __init__(self, size = PING_WINDOW):
+        """
+        Constructor
+
+        Arguments:
+            size    -- number of samples to keep
+
+        """
+
+        # (delay, offset) in us
+        self.__samples = deque(maxlen = size)
+        self.__srtt = None
+        self.__jitter = 0.0
+
+    #------------------------------------------------------------------
+    # PUBLIC
+
+    def sample(self, t1, t2, t3, t4):
+        """
+        Add a ping/pong exchange, returns (delay, offset) in us
+
+        Arguments:
+            t1      -- client time the ping was sent
+            t2      -- server time the ping arrived
+            t3      -- server time the pong was sent
+            t4      -- client time the pong arrived
+
+        """
+
+        delay = max(0, (t4 - t1) - (t3 - t2))
+        offset = ((t2 - t1) + (t3 - t4)) / 2
+        if self.__srtt == None:
+            self.__srtt = float(delay)
+        else:
+            self.__jitter = 0.75 * self.__jitter + 0.25 * abs(delay - self.__srtt)
+            self.__srtt = 0.875 * self.__srtt + 0.125 * delay
+        self.__samples.append((delay, offset))
+        return delay, offset
+
+    def count(self):
+        return len(self.__samples)
+
+    def rtt(self):
+        """ Smoothed round trip time in seconds or None if no samples """
+
+        if self.__srtt == None:
+            return None
+        return self.__srtt / 1000000
+
+    def min_rtt(self):
+        """ Least round trip time in the window in seconds or None """
+
+        if len(self.__samples) == 0:
+            return None
+        return min(self.__samples)[0] / 1000000
+
+    def jitter(self):
+        """ Mean deviation of the round trip time in seconds """
+
+        return self.__jitter / 1000000
+
+    def offset(self):
+        """ Server clock less client clock in seconds or None """
+
+        if len(self.__samples) == 0:
+            return None
+        return min(self.__samples)[1] / 1000000
+
+    def to_local(self, server_us):
+        """
+        Server timestamp in us as local monotonic seconds or None
+
+        Arguments:
+            server_us   -- server timestamp e.g. from EVNT_DONE
+
+        """
+
+        offset = self.offset()
+        if offset == None:
+            return None
+        return server_us / 1000000 - offset
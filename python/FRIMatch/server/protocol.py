@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+#
+# protocol.py
+#
+# Copyright (C) 2021 by G3UKB Bob Cowdery
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#  The author can be reached by email at:
+#     bob@bobcowdery.plus.com
+#
+
+"""
+----------------------------------------------------------------------
+ Wire protocol between the Remote Auto-Tuner client(s) and server.
+
+ Binary frames are a fixed header followed by struct packed arguments:
+
+    magic (B) | version (B) | opcode (B) | request id (H) | sequence (H) | session (H) | arguments ...
+
+ The request id is chosen by the client, 0 for none. Commands with an id
+ are answered with EVNT_DONE carrying the same id once they have completed,
+ for moves that is when the servos have settled.
+ A non-zero sequence number asks for delivery to be acknowledged with
+ EVNT_ACK, see reliable.py. The session is chosen at random by a client
+ when it starts so the server can tell a restarted client, whose sequence
+ numbers start again, from retransmits. Events carry session 0.
+
+ The pickled list/tuple form used by older clients is still understood.
+ A client starts in pickle and sends CMD_WAKEUP with its protocol version,
+ the server then answers in binary and the client switches over when it
+ sees the first binary event. Old servers ignore the wakeup parameter and
+ keep answering in pickle so the client stays with pickle.
+----------------------------------------------------------------------
+"""
+
+# System imports
+import struct
+import pickle
+
+# Application imports
+from server_defs import *
+
+# Frame identification
+PROTOCOL_MAGIC = 0xA7
+PROTOCOL_VERSION = 14
+# Largest request datagram the server reads
+MAX_REQUEST = 512
+
+# Encodings
+ENC_PICKLE = 'ENC_PICKLE'
+ENC_BINARY = 'ENC_BINARY'
+
+# Opcodes free for added commands
+PLUGIN_FIRST = 0x40
+PLUGIN_LAST = 0x6F
+
+# Relay cycle modes
+_CYCLE_MODES = ('inclusive', 'exclusive')
+
+class ProtocolError(Exception):
+    pass
+
+#======================================================================================================================
+# Argument layouts
+class _Fixed:
+    """ Fixed number of struct packed values """
+
+    def __init__(self, fmt, scalar = False):
+        self.__struct = struct.Struct('!' + fmt)
+        self.__scalar = scalar
+
+    def pack(self, params):
+        if self.__scalar:
+            params = (params,)
+        return self.__struct.pack(*[int(p) for p in params])
+
+    def unpack(self, buf, offset):
+        values = self.__struct.unpack_from(buf, offset)
+        if self.__scalar:
+            return values[0]
+        return list(values)
+
+class _Pins:
+    """ Variable list of [pin, invert] pairs preceded by a count """
+
+    __count = struct.Struct('!B')
+    __pin = struct.Struct('!BB')
+
+    def pack(self, params):
+        out = [self.__count.pack(len(params))]
+        for pin, inv in params:
+            out.append(self.__pin.pack(int(pin), bool(inv)))
+        return b''.join(out)
+
+    def unpack(self, buf, offset):
+        count, = self.__count.unpack_from(buf, offset)
+        offset += self.__count.size
+        pins = []
+        for n in range(count):
+            pin, inv = self.__pin.unpack_from(buf, offset)
+            offset += self.__pin.size
+            pins.append((pin, bool(inv)))
+        return pins
+
+class _PinsMode(_Pins):
+    """ Pin list followed by a cycle mode """
+
+    def pack(self, params):
+        pins, mode = params
+        if mode not in _CYCLE_MODES:
+            raise ProtocolError('Invalid cycle mode %s' % str(mode))
+        return _Pins.pack(self, pins) + struct.pack('!B', _CYCLE_MODES.index(mode))
+
+    def unpack(self, buf, offset):
+        pins = _Pins.unpack(self, buf, offset)
+        mode, = struct.unpack_from('!B', buf, offset + 1 + 2*len(pins))
+        return [pins, _CYCLE_MODES[mode]]
+
+class _PinsFixed(_Pins):
+    """ Pin list followed by fixed fields """
+
+    def __init__(self, fmt):
+        self.__fixed = struct.Struct('!' + fmt)
+
+    def pack(self, params):
+        return _Pins.pack(self, params[0]) + self.__fixed.pack(*[int(p) for p in params[1:]])
+
+    def unpack(self, buf, offset):
+        pins = _Pins.unpack(self, buf, offset)
+        return [pins] + list(self.__fixed.unpack_from(buf, offset + 1 + 2*len(pins)))
+
+class _Memory:
+    """ Memory id, taps, tx, ant then the name and frequency as counted UTF-8 """
+
+    __head = struct.Struct('!HHBB')
+    __len = struct.Struct('!B')
+
+    def pack(self, params):
+        memory_id, name, freq, taps, tx, ant = params
+        out = [self.__head.pack(int(memory_id), int(taps), int(tx), int(ant))]
+        for text in (name, freq):
+            data = str(text).encode('utf-8')
+            out.append(self.__len.pack(len(data)))
+            out.append(data)
+        return b''.join(out)
+
+    def unpack(self, buf, offset):
+        memory_id, taps, tx, ant = self.__head.unpack_from(buf, offset)
+        offset += self.__head.size
+        text = []
+        for n in range(2):
+            length, = self.__len.unpack_from(buf, offset)
+            offset += self.__len.size
+            if offset + length > len(buf):
+                raise IndexError('memory text')
+            text.append(bytes(buf[offset:offset + length]).decode('utf-8', 'replace'))
+            offset += length
+        return [memory_id, text[0], text[1], taps, tx, ant]
+
+class _Batch:
+    """ Batch id, then a count of sub-commands each as opcode, length, arguments """
+
+    __head = struct.Struct('!HB')
+    __entry = struct.Struct('!BB')
+
+    def pack(self, params):
+        batch_id, cmds = params
+        out = [self.__head.pack(batch_id, len(cmds))]
+        for cmd, cmd_params in cmds:
+            if cmd == CMD_BATCH or cmd not in _COMMANDS:
+                raise ProtocolError('Invalid batch entry %s' % str(cmd))
+            code, layout = _COMMANDS[cmd]
+            body = layout.pack(cmd_params)
+            out.append(self.__entry.pack(code, len(body)))
+            out.append(body)
+        return b''.join(out)
+
+    def unpack(self, buf, offset):
+        batch_id, count = self.__head.unpack_from(buf, offset)
+        offset += self.__head.size
+        cmds = []
+        for n in range(count):
+            code, length = self.__entry.unpack_from(buf, offset)
+            offset += self.__entry.size
+            if code not in _COMMAND_CODES or _COMMAND_CODES[code][0] == CMD_BATCH:
+                raise ProtocolError('Invalid batch entry 0x%02x' % code)
+            name, layout = _COMMAND_CODES[code]
+            if offset + length > len(buf):
+                raise ProtocolError('Truncated batch entry for %s' % name)
+            cmds.append([name, layout.unpack(buf, offset)])
+            offset += length
+        return [batch_id, cmds]
+
+_NONE = _Fixed('')
+
+#======================================================================================================================
+# Opcode tables
+#   name : (opcode, layout)
+_COMMANDS = {
+    CMD_WAKEUP:             (0x01, _Fixed('B')),
+    CMD_SERVO_SETTINGS:     (0x02, _Fixed('HHHH')),
+    CMD_SERVO_STATS:        (0x03, _Fixed('B')),
+    CMD_SERVOS_MOVE:        (0x04, _Fixed('BBB')),
+    CMD_SERVOS_HOME:        (0x05, _NONE),
+    CMD_PROGRESS_RATE:      (0x06, _Fixed('B')),
+    CMD_PING:               (0x07, _Fixed('Q')),
+    CMD_SUBSCRIBE:          (0x08, _Fixed('BH')),
+    CMD_UNSUBSCRIBE:        (0x09, _Fixed('H')),
+    CMD_GET_STATE:          (0x0A, _NONE),
+    CMD_TUNE_SETTINGS:      (0x0B, _Fixed('HHB')),
+    CMD_TX_SERVO_SET_PWM:   (0x10, _Fixed('HH')),
+    CMD_TX_SERVO_TEST:      (0x11, _NONE),
+    CMD_TX_SERVO_HOME:      (0x12, _NONE),
+    CMD_TX_SERVO_MOVE:      (0x13, _Fixed('BB')),
+    CMD_TX_SERVO_STOP:      (0x14, _NONE),
+    CMD_ANT_SERVO_SET_PWM:  (0x20, _Fixed('HH')),
+    CMD_ANT_SERVO_TEST:     (0x21, _NONE),
+    CMD_ANT_SERVO_HOME:     (0x22, _NONE),
+    CMD_ANT_SERVO_MOVE:     (0x23, _Fixed('BB')),
+    CMD_ANT_SERVO_STOP:     (0x24, _NONE),
+    CMD_RELAYS_INIT:        (0x30, _Pins()),
+    CMD_RELAYS_SET:         (0x31, _Pins()),
+    CMD_RELAYS_RESET:       (0x32, _Pins()),
+    CMD_RELAYS_CYCLE:       (0x33, _PinsMode()),
+    CMD_MEMORIES_INIT:      (0x38, _PinsFixed('H')),
+    CMD_MEMORY_STORE:       (0x39, _Memory()),
+    CMD_RECALL_MEMORY:      (0x3A, _Fixed('H')),
+    CMD_TUNE:               (0x3B, _PinsFixed('HBBB')),
+    CMD_BATCH:              (0x70, _Batch()),
+    CMD_RESET:              (0x7F, _NONE),
+}
+
+_EVENTS = {
+    EVNT_HEARTBEAT:         (0x80, _NONE),
+    EVNT_TX:                (0x81, _Fixed('B', True)),
+    EVNT_ANT:               (0x82, _Fixed('B', True)),
+    EVNT_BATCH:             (0x83, _Fixed('HB')),
+    # channel, moves, steps, overruns, worst us, last steps, last overruns, last worst us, last mean us
+    EVNT_STATS:             (0x84, _Fixed('BIIIIHHII')),
+    EVNT_POS:               (0x85, _Fixed('BB')),
+    # rid, status, tx, ant, start us, end us, elapsed us
+    EVNT_DONE:              (0x86, _Fixed('HBBBQQI')),
+    EVNT_ACK:               (0x87, _Fixed('H', True)),
+    # client send, server receive, server send, us
+    EVNT_PONG:              (0x88, _Fixed('QQQ')),
+    # tx, ant, tx commanded, ant commanded, relay state
+    EVNT_STATE:             (0x89, _Fixed('BBBBH')),
+}
+
+_header = struct.Struct('!BBBHHH')
+_prefix = struct.Struct('!BBB')
+
+def _reverse(table):
+    return {code: (name, layout) for name, (code, layout) in table.items()}
+
+_COMMAND_CODES = _reverse(_COMMANDS)
+_EVENT_CODES = _reverse(_EVENTS)
+
+#======================================================================================================================
+# PUBLIC
+def is_binary(data):
+    """
+    True if the datagram is a binary frame
+
+    Arguments:
+        data    -- the datagram
+    """
+
+    return len(data) >= _prefix.size and data[0] == PROTOCOL_MAGIC
+
+def encode_command(cmd, params, encoding = ENC_BINARY, rid = 0, seq = 0, session = 0):
+    """
+    Encode a command for the wire
+
+    Arguments:
+        cmd         -- command type
+        params      -- command parameters
+        encoding    -- ENC_BINARY | ENC_PICKLE
+        rid         -- request id, binary only
+        seq         -- sequence number to be acked, binary only
+        session     -- sender's session, binary only
+    """
+
+    if encoding == ENC_PICKLE:
+        return pickle.dumps([cmd, params])
+    return _encode(_COMMANDS, cmd, params, rid, seq, session)
+
+def decode_command(data):
+    """
+    Decode a command from the wire
+
+    Arguments:
+        data    -- the datagram
+
+    Returns (cmd, params, encoding, rid, seq, session), raises ProtocolError if invalid
+    """
+
+    if is_binary(data):
+        cmd, params, rid, seq, session = _decode(_COMMAND_CODES, data)
+        return cmd, params, ENC_BINARY, rid, seq, session
+    try:
+        cmd = pickle.loads(data)
+        return cmd[0], cmd[1], ENC_PICKLE, 0, 0, 0
+    except Exception as e:
+        raise ProtocolError('Failed to unpickle request data [%s]' % str(e))
+
+def encode_event(evt, data, encoding = ENC_BINARY):
+    """
+    Encode an event for the wire
+
+    Arguments:
+        evt         -- event type
+        data        -- event data
+        encoding    -- ENC_BINARY | ENC_PICKLE
+    """
+
+    if encoding == ENC_PICKLE:
+        return pickle.dumps((evt, data))
+    return _encode(_EVENTS, evt, data)
+
+def decode_event(data):
+    """
+    Decode an event from the wire
+
+    Arguments:
+        data    -- the datagram
+
+    Returns (evt, data, encoding), raises ProtocolError if invalid
+    """
+
+    if is_binary(data):
+        evt, params, rid, seq, session = _decode(_EVENT_CODES, data)
+        return evt, params, ENC_BINARY
+    try:
+        evt = pickle.loads(data)
+        return evt[0], evt[1], ENC_PICKLE
+    except Exception as e:
+        raise ProtocolError('Failed to unpickle event data [%s]' % str(e))
+
+def register_command(cmd, code, fmt):
+    """
+    Give an added command an opcode, see dispatch.py
+
+    Arguments:
+        cmd         -- command type
+        code        -- opcode, PLUGIN_FIRST to PLUGIN_LAST
+        fmt         -- struct format of the arguments e.g. 'BH'
+    """
+
+    if code < PLUGIN_FIRST or code > PLUGIN_LAST:
+        raise ProtocolError('Opcode 0x%02x outside the plugin range' % code)
+    if cmd in _COMMANDS or code in _COMMAND_CODES:
+        raise ProtocolError('Command %s or opcode 0x%02x already in use' % (str(cmd), code))
+    layout = _Fixed(fmt)
+    _COMMANDS[cmd] = (code, layout)
+    _COMMAND_CODES[code] = (cmd, layout)
+
+def check_command(cmd, params):
+    """
+    Check a command has the opcode and argument layout the binary encoding
+    requires, raises ProtocolError if not. Used to vet the contents of a
+    pickled batch before any of it is executed.
+
+    Arguments:
+        cmd         -- command type
+        params      -- command parameters
+    """
+
+    _encode(_COMMANDS, cmd, params)
+
+def event_encoding(cmd, params, encoding, current):
+    """
+    Negotiate the encoding to use for events to the sender of a command
+
+    Arguments:
+        cmd         -- command type
+        params      -- command parameters
+        encoding    -- encoding the command arrived in
+        current     -- encoding currently in use for this client
+    """
+
+    if encoding == ENC_BINARY:
+        return ENC_BINARY
+    if cmd == CMD_WAKEUP:
+        # A wakeup announces what the client can do
+        if len(params) > 0 and params[0] == PROTOCOL_VERSION:
+            return ENC_BINARY
+        return ENC_PICKLE
+    return current
+
+#======================================================================================================================
+# PRIVATE
+def _encode(table, name, params, rid = 0, seq = 0, session = 0):
+    try:
+        code, layout = table[name]
+        return _header.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, code, rid, seq, session) + layout.pack(params)
+    except KeyError:
+        raise ProtocolError('No opcode for %s' % str(name))
+    except (struct.error, TypeError, ValueError) as e:
+        raise ProtocolError('Invalid parameters for %s [%s]' % (name, str(e)))
+
+def _decode(table, data):
+    # Check the version before relying on the rest of the header
+    magic, version, code = _prefix.unpack_from(data)
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError('Unsupported protocol version %d' % version)
+    try:
+        name, layout = table[code]
+        magic, version, code, rid, seq, session = _header.unpack_from(data)
+        return name, layout.unpack(data, _header.size), rid, seq, session
+    except KeyError:
+        raise ProtocolError('Unknown opcode 0x%02x' % code)
+    except (struct.error, IndexError) as e:
+        raise ProtocolError('Truncated frame for %s [%s]' % (name, str(e)))
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+#
+# pwm.py
+#
+# Copyright (C) 2021 by G3UKB Bob Cowdery
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#  The author can be reached by email at:
+#     bob@bobcowdery.plus.com
+#
+
+"""
+----------------------------------------------------------------------
+ Driver for the servo controller.
+
+    Controller:     Adafruit 16-Channel 12-bit PWM/Servo Driver - I2C interface - PCA9685
+
+ One PWMDriver owns the controller for all servos. Each channel has a table
+ of the four LEDn register bytes for every whole degree, worked out when the
+ pulse range is set, so a step is a table lookup. Angles are staged and
+ flush() writes all the changed channels once per tick, adjacent channels
+ in a single auto-increment burst.
+
+ The bus is anything with write(address, register, data). BusioBus talks
+ to the I2C bus on the Pi, MockBus keeps a register image for testing off
+ the Pi.
+----------------------------------------------------------------------
+"""
+
+# System imports
+from time import sleep
+
+# Import the Adafruit libs
+pwm_test_mode = False
+try:
+    import board
+    import busio
+except (ModuleNotFoundError, NotImplementedError):
+    print("Servo - not running on RPi, using test mode!")
+    pwm_test_mode = True
+
+# PCA9685 registers
+MODE1 = 0x00
+LED0_ON_L = 0x06
+PRESCALE = 0xFE
+# MODE1 bits
+MODE1_RESTART = 0x80
+MODE1_AI = 0x20
+MODE1_SLEEP = 0x10
+
+PCA9685_ADDRESS = 0x40
+PCA9685_OSC = 25000000
+PCA9685_CHANNELS = 16
+
+SERVO_FREQUENCY = 50    # Hz
+SERVO_RANGE = 180       # degrees
+
+#======================================================================================================================
+# Bus backends
+class BusioBus:
+    """ The Pi I2C bus through Adafruit busio """
+
+    def __init__(self):
+
+        self.__i2c = busio.I2C(board.SCL, board.SDA)
+
+    def write(self, address, register, data):
+
+        while not self.__i2c.try_lock():
+            pass
+        try:
+            self.__i2c.writeto(address, bytes([register]) + bytes(data))
+        finally:
+            self.__i2c.unlock()
+
+class MockBus:
+    """ Register image of the controller """
+
+    def __init__(self):
+
+        self.regs = bytearray(256)
+        # Number of bus transactions
+        self.writes = 0
+
+    def write(self, address, register, data):
+
+        self.regs[register:register + len(data)] = data
+        self.writes += 1
+
+#======================================================================================================================
+# The driver
+class PWMDriver:
+
+    def __init__(self, bus = None, address = PCA9685_ADDRESS, frequency = SERVO_FREQUENCY):
+        """
+        Constructor
+
+        Arguments:
+            bus         -- bus backend, default is the Pi bus or a MockBus in test mode
+            address     -- I2C address of the controller
+            frequency   -- PWM frequency in Hz
+
+        """
+
+        if bus == None:
+            if pwm_test_mode:
+                bus = MockBus()
+            else:
+                bus = BusioBus()
+        self.__bus = bus
+        self.__address = address
+        self.__frequency = frequency
+
+        # Per channel angle -> register bytes
+        self.__tables = {}
+        # Angles waiting for flush()
+        self.__staged = {}
+
+        self.__init_controller()
+
+    #------------------------------------------------------------------
+    # PUBLIC
+
+    def bus(self):
+        return self.__bus
+
+    def set_range(self, channel, low, high):
+        """
+        Set the pulse range of a channel
+
+        Arguments:
+            channel     -- channel on the controller
+            low         -- pulse width in us at 0 degrees
+            high        -- pulse width in us at SERVO_RANGE degrees
+
+        """
+
+        period = 1000000.0 / self.__frequency
+        table = []
+        for angle in range(SERVO_RANGE + 1):
+            pulse = low + (high - low) * angle / SERVO_RANGE
+            off = min(4095, int(pulse * 4096 / period))
+            table.append(bytes((0, 0, off & 0xFF, off >> 8)))
+        self.__tables[channel] = table
+
+    def set_angle(self, channel, angle):
+        """
+        Stage a channel angle for the next flush()
+
+        Arguments:
+            channel     -- channel on the controller
+            angle       -- degrees (0 - SERVO_RANGE)
+
+        """
+
+        self.__staged[channel] = max(0, min(SERVO_RANGE, int(angle)))
+
+    def flush(self):
+        """ Write the staged angles """
+
+        if len(self.__staged) == 0:
+            return
+        channels = sorted(self.__staged)
+        # Runs of adjacent channels go in one burst
+        start = channels[0]
+        data = bytearray()
+        for n, channel in enumerate(channels):
+            if n > 0 and channel != channels[n - 1] + 1:
+                self.__write_run(start, data)
+                start = channel
+                data = bytearray()
+            data += self.__tables[channel][self.__staged[channel]]
+        self.__write_run(start, data)
+        self.__staged.clear()
+
+    #------------------------------------------------------------------
+    # PRIVATE
+
+    def __init_controller(self):
+
+        prescale = int(round(PCA9685_OSC / (4096.0 * self.__frequency))) - 1
+        # Prescale can only be set while asleep
+        self.__bus.write(self.__address, MODE1, bytes((MODE1_SLEEP,)))
+        self.__bus.write(self.__address, PRESCALE, bytes((prescale,)))
+        self.__bus.write(self.__address, MODE1, bytes((MODE1_AI,)))
+        if not pwm_test_mode:
+            # Oscillator start up
+            sleep(0.005)
+        self.__bus.write(self.__address, MODE1, bytes((MODE1_AI | MODE1_RESTART,)))
+
+    def __write_run(self, channel, data):
+
+        self.__bus.write(self.__address, LED0_ON_L + 4*channel, data)
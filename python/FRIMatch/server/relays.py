@@ -23,130 +23,357 @@
 
 # System imports
 import os, sys
-from time import sleep
+import threading
 
 # Library imports
+# libgpiod sets all changed lines in one request, else RPi.GPIO
 gpio_test_mode = False
+try:
+    import gpiod
+    from gpiod.line import Direction, Value
+except ModuleNotFoundError:
+    gpiod = None
 try:
     import RPi.GPIO as GPIO
 except ModuleNotFoundError:
+    GPIO = None
+if gpiod == None and GPIO == None:
     print("GPIO - not running on RPi, using test mode!")
     gpio_test_mode = True
 
 # Application imports
 
-class Relays:
+# Seconds between relay changes when cycling
+CYCLE_PERIOD = 2.0
+# GPIO chip for libgpiod
+GPIOD_CHIP = '/dev/gpiochip0'
 
+"""
+Runs timed relay sequences off the network path.
+A sequence is a list of (delay, action) steps, each action called delay
+seconds after the step before. Timing comes from call_later(delay, fn),
+which returns a handle with cancel(); threading.Timer by default or the
+event loop's call_later when running on asyncio. Starting a sequence or
+cancel() abandons the one running.
+"""
+class Sequencer:
+    
+    def __init__(self, call_later = None):
+        """
+        Constructor
+        
+        Arguments:
+            call_later  -- callable(delay, fn) returning a handle with cancel()
+            
+        """
+        
+        if call_later == None:
+            call_later = _call_later
+        self.__call_later = call_later
+        # Sequence running, bumped to abandon it
+        self.__run = 0
+        self.__handle = None
+        # Actions may start or cancel sequences themselves
+        self.__lock = threading.RLock()
+    
     #----------------------------------------------------
-    def init(self):
-        # Will hold current array of all configured pins
-        self.__pinArray = []
+    def set_call_later(self, call_later):
+        self.__call_later = call_later
+    
+    def run(self, steps):
+        # Start a sequence
+        #           delay, action
+        # Form is: [[0, fn], [2.0, fn]]
+        with self.__lock:
+            self.__cancel()
+            self.__next(self.__run, list(steps))
+    
+    def cancel(self):
+        # Abandon the sequence running if any
+        with self.__lock:
+            self.__cancel()
+    
+    def busy(self):
+        return self.__handle != None
+    
+    # =================================================================================
+    # PRIVATE
+    def __cancel(self):
+        self.__run += 1
+        if self.__handle != None:
+            self.__handle.cancel()
+            self.__handle = None
+    
+    def __next(self, run, steps):
+        if len(steps) == 0:
+            self.__handle = None
+            return
+        delay, action = steps[0]
+        self.__handle = self.__call_later(delay, lambda: self.__step(run, action, steps[1:]))
+    
+    def __step(self, run, action, steps):
+        with self.__lock:
+            if run != self.__run:
+                # Cancelled as it fired
+                return
+            try:
+                action()
+            except Exception as e:
+                print('Relay sequence failed [%s]' % str(e))
+                self.__handle = None
+                return
+            if run == self.__run:
+                self.__next(run, steps)
+
+def _call_later(delay, fn):
+    timer = threading.Timer(delay, fn)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+"""
+Output line backends.
+Each takes the BCM pins to drive and writes levels as {pin: high}, all
+in one call. The Relays class below only ever passes lines that change.
+"""
+class GpiodLines:
+    """ libgpiod, one request holds all the lines """
+    
+    def __init__(self, chip = GPIOD_CHIP):
         
-        if not gpio_test_mode:
-            # Set mode
-            GPIO.setmode(GPIO.BCM)
+        self.__chip = chip
+        self.__request = None
+        self.__levels = {}
+    
+    def setup(self, levels):
+        # Add lines at the given levels, the request is remade with them all
+        self.__levels.update(levels)
+        if self.__request != None:
+            self.__request.release()
+        config = {}
+        for pin, high in self.__levels.items():
+            config[pin] = gpiod.LineSettings(direction = Direction.OUTPUT, output_value = _value(high))
+        self.__request = gpiod.request_lines(self.__chip, consumer = 'auto-tuner', config = config)
+    
+    def write(self, levels):
+        self.__levels.update(levels)
+        self.__request.set_values({pin: _value(high) for pin, high in levels.items()})
+    
+    def close(self):
+        if self.__request != None:
+            self.__request.release()
+            self.__request = None
+
+def _value(high):
+    if high:
+        return Value.ACTIVE
+    return Value.INACTIVE
+
+class RPiLines:
+    """ RPi.GPIO """
+    
+    def __init__(self):
+        
+        GPIO.setmode(GPIO.BCM)
+    
+    def setup(self, levels):
+        for pin, high in levels.items():
+            GPIO.setup(pin, GPIO.OUT, initial = _level(high))
+    
+    def write(self, levels):
+        GPIO.output(list(levels.keys()), [_level(high) for high in levels.values()])
+    
+    def close(self):
+        GPIO.cleanup()
+
+def _level(high):
+    if high:
+        return GPIO.HIGH
+    return GPIO.LOW
+
+class MockLines:
+    """ Line levels for testing off the Pi """
+    
+    def __init__(self):
+        
+        self.levels = {}
+        # Number of write calls
+        self.writes = 0
+    
+    def setup(self, levels):
+        self.levels.update(levels)
+    
+    def write(self, levels):
+        self.levels.update(levels)
+        self.writes += 1
+    
+    def close(self):
+        pass
+
+def default_lines():
+    if gpiod != None:
+        return GpiodLines()
+    if GPIO != None:
+        return RPiLines()
+    return MockLines()
+
+"""
+The relays are held as a bitmask of energised pins and only the pins
+that change are written, so setting the range it is already on writes
+nothing and the relays never chatter.
+"""
+class Relays:
+
+    #----------------------------------------------------
+    def init(self, sequencer = None, lines = None):
+        # All configured pins, pin : invert
+        self.__inverts = {}
+        # Bit per configured and per energised pin
+        self.__configured = 0
+        self.__energised = 0
+        # Runs cycles and other timed patterns
+        if sequencer == None:
+            sequencer = Sequencer()
+        self.__sequencer = sequencer
+        # Output lines
+        if lines == None:
+            lines = default_lines()
+        self.__lines = lines
+        # Requests and sequences run on different threads
+        self.__lock = threading.Lock()
     
     #----------------------------------------------------
     def init_pins(self, pin_array):
         # Initialise all pins in the pin array
         #           pin,invert
         # Form is: [[4, False], [17, False], [18, False]]
-        for pin in pin_array:
-            if pin not in self.__pinArray:
-                self.__pinArray.append(pin)
+        self.__sequencer.cancel()
+        new = {}
+        with self.__lock:
+            for pin in pin_array:
+                p = int(pin[0])
+                if p not in self.__inverts:
+                    # Start de-energised
+                    new[p] = bool(pin[1])
+                self.__inverts[p] = bool(pin[1])
+                self.__configured |= 1 << p
+            if len(new) > 0:
+                self.__lines.setup(new)
         if gpio_test_mode:
             print ('Initialise pins %s' % str(pin_array))
-        else:
-            # Initialise pins
-            for pin in pin_array:
-                GPIO.setup(int(pin[0]), GPIO.OUT)
 
     #----------------------------------------------------
     def set_pins(self, pin_array):
-        # Energise all relays in the array
+        # Energise all relays in the array, all others off
         #           pin,invert
         # Form is: [[4, False], [17, False], [18, False]]
+        self.__sequencer.cancel()
         if gpio_test_mode:
             print ('Energise pins %s' % str(pin_array))
-        else:
-            self.__all_off(self.__pinArray)
-            self.__rlys_on(pin_array)
+        self.__apply(lambda energised: self.__mask(pin_array))
     
     #----------------------------------------------------
     def reset_pins(self, pin_array):
-        # De-energise all relays in the array
+        # De-energise all relays
         #           pin,invert
         # Form is: [[4, False], [17, False], [18, False]]
+        self.__sequencer.cancel()
         if gpio_test_mode:
             print ('De-energise pins %s' % str(pin_array))
-        else:
-            self.__all_off(self.__pinArray)
+        self.__apply(lambda energised: 0)
             
     #----------------------------------------------------
     def cycle_pins(self, pin_array, mode):
-        # Cycle relays in the map for a test
+        # Cycle relays in the map for a test, returns at once
         #           pin,invert
         # Form is: [[4, False], [17, False], [18, False]]
         if gpio_test_mode:
             print ('Cycle pins %s' % str(pin_array))
-        else:
-            self.__all_off(self.__pinArray)
+        self.__apply(lambda energised: 0)
+        steps = []
+        delay = 0
         if mode == 'inclusive':
-            for n in range(len(pin_array)):
-                if gpio_test_mode:
-                    print('Pin %d on' % pin_array[n][0])
-                else:
-                    self.__rlys_on([pin_array[n]])
-                sleep(2.0)
-            pins_reversed = list(reversed(pin_array))
-            for n in range(len(pins_reversed)):
-                if gpio_test_mode:
-                    print('Pin %d off' % pin_array[n][0])
-                else:
-                    self.__rlys_off([pins_reversed[n]])
-                sleep(2.0)
+            # On in turn then off in reverse
+            for pin in pin_array:
+                steps.append((delay, lambda pin=pin: self.__pin_on(pin)))
+                delay = CYCLE_PERIOD
+            for pin in reversed(pin_array):
+                steps.append((delay, lambda pin=pin: self.__pin_off(pin)))
         else:
-            # Exclusive
-            for n in range(len(pin_array)):
-                if gpio_test_mode:
-                    print('Pin %d on' % pin_array[n][0])
-                else:
-                    self.__rlys_on([pin_array[n]])
-                sleep(2.0)
-                if gpio_test_mode:
-                    print('Pin %d off' % pin_array[n][0])
-                else:
-                    self.__rlys_off([pin_array[n]])
+            # Exclusive, each on alone
+            for pin in pin_array:
+                steps.append((delay, lambda pin=pin: self.__pin_on(pin)))
+                steps.append((CYCLE_PERIOD, lambda pin=pin: self.__pin_off(pin)))
+        self.__sequencer.run(steps)
+    
+    def sequence(self, steps):
+        # Run a timed pattern, see Sequencer
+        self.__sequencer.run(steps)
+    
+    def energised(self):
+        # Bitmask of energised pins, bit n is BCM pin n
+        return self.__energised
+    
+    #----------------------------------------------------
+    # Break before make, see tune.py
+    def plan(self, pin_array):
+        # (breaking, making) to end with only the array energised
+        #           pin,invert
+        # Form is: [[4, False], [17, False], [18, False]]
+        with self.__lock:
+            target = self.__mask(pin_array) & self.__configured
+            return self.__energised & ~target != 0, target & ~self.__energised != 0
+    
+    def break_pins(self, pin_array):
+        # Turn off every relay not in the array
+        if gpio_test_mode:
+            print ('Break for pins %s' % str(pin_array))
+        target = self.__mask(pin_array)
+        self.__apply(lambda energised: energised & target)
+    
+    def make_pins(self, pin_array):
+        # Energise the relays in the array
+        if gpio_test_mode:
+            print ('Make pins %s' % str(pin_array))
+        self.__apply(lambda energised: self.__mask(pin_array))
                 
     #----------------------------------------------------
     def close(self):
         # Cleanup before exit
-        if not gpio_test_mode:
-            GPIO.cleanup()
+        self.__sequencer.cancel()
+        self.__lines.close()
     
     # =================================================================================
     # PRIVATE
-    def __rlys_on(self, energise_pins):
-        #           pin,invert
-        # Form is: [[4, False], [17, False], [18, False]]
-        for pin in energise_pins:
-            if pin[1] : level = GPIO.LOW
-            else: level = GPIO.HIGH
-            GPIO.output(int(pin[0]), level)
+    def __pin_on(self, pin):
+        if gpio_test_mode:
+            print('Pin %d on' % pin[0])
+        self.__apply(lambda energised: energised | self.__mask([pin]))
     
-    def __rlys_off(self, deenergise_pins): 
-        #           pin,invert
-        # Form is: [[4, False], [17, False], [18, False]]
-        for pin in deenergise_pins:
-            if pin[1] : level = GPIO.HIGH
-            else: level = GPIO.LOW
-            GPIO.output(int(pin[0]), level)
-            
-    def __all_off(self, all_pins):
+    def __pin_off(self, pin):
+        if gpio_test_mode:
+            print('Pin %d off' % pin[0])
+        self.__apply(lambda energised: energised & ~self.__mask([pin]))
+    
+    def __mask(self, pin_array):
         #           pin,invert
         # Form is: [[4, False], [17, False], [18, False]]
-        for pin in all_pins:
-            if pin[1] : level = GPIO.HIGH
-            else: level = GPIO.LOW
-            GPIO.output(int(pin[0]), level)
-        
\ No newline at end of file
+        mask = 0
+        for pin in pin_array:
+            mask |= 1 << int(pin[0])
+        return mask
+    
+    def __apply(self, change):
+        # Write only the configured pins that change
+        with self.__lock:
+            # Pins never initialised stay off
+            energised = change(self.__energised) & self.__configured
+            changed = energised ^ self.__energised
+            levels = {}
+            for pin, invert in self.__inverts.items():
+                if changed & (1 << pin):
+                    # Energised is high unless inverted
+                    levels[pin] = bool(energised & (1 << pin)) != invert
+            if len(levels) > 0:
+                self.__lines.write(levels)
+            self.__energised = energised
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+#
+# reliable.py
+#
+# Copyright (C) 2021 by G3UKB Bob Cowdery
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#  The author can be reached by email at:
+#     bob@bobcowdery.plus.com
+#
+
+"""
+----------------------------------------------------------------------
+ Optional reliable delivery of commands, binary encoding only.
+
+ A command sent with a non-zero sequence number is acknowledged by the
+ server with EVNT_ACK as soon as it arrives. The sender retransmits with
+ the same sequence number if no ack comes within the retransmit timeout,
+ which follows the measured round trip time (RFC 6298 style) and backs
+ off on each retry. The server remembers recent sequence numbers from each
+ sender so a retransmitted command is acked again but not executed twice.
+ Each sender picks a session when it starts, a new session from the same
+ address starts the remembered sequence numbers again.
+
+ Moves are latest-wins: they are sent without a sequence number and never
+ retried, and sending one abandons retries of anything else that only
+ moves the capacitors it moves, as that would be out of date. A move of
+ one capacitor leaves anything that also moves the other alone. Anything
+ that also sets the relays or recalls a memory is retried regardless, a
+ move does not replace what it does to the relays.
+
+ The sender thread does all the sending so callers never wait on the
+ network. Commands go through a bounded queue in the order they are due,
+ a command may be held back by a delay, and each one has a future that
+ completes with its status once acked, sent, superseded or given up. A
+ full queue drops the command unless the caller asks to wait for room,
+ which commands that must not be lost should do.
+----------------------------------------------------------------------
+"""
+
+# System imports
+import threading
+import heapq
+import random
+from collections import deque
+from concurrent.futures import Future
+from time import monotonic
+
+# Application imports
+from server_defs import *
+
+# Retransmit timeout, s
+INITIAL_RTO = 0.5
+MIN_RTO = 0.05
+MAX_RTO = 2.0
+# Retransmits before giving up
+MAX_RETRIES = 4
+# Sequence numbers remembered per sender
+SEQ_WINDOW = 64
+# Commands waiting to be sent
+SEND_QUEUE = 32
+
+# Send status as the result of the future from send()
+SEND_OK = 0
+SEND_SUPERSEDED = 1
+SEND_FAILED = 2
+
+# Sent without a sequence number, never retried
+NO_RETRY = (CMD_TX_SERVO_MOVE, CMD_ANT_SERVO_MOVE, CMD_SERVOS_MOVE)
+
+# Capacitors as a mask
+TX_AXIS = 0x01
+ANT_AXIS = 0x02
+# Capacitors each command that only moves drives, CMD_TUNE when it leaves the relays alone is worked out
+_AXES = {
+    CMD_TX_SERVO_MOVE: TX_AXIS, CMD_TX_SERVO_TEST: TX_AXIS, CMD_TX_SERVO_HOME: TX_AXIS,
+    CMD_ANT_SERVO_MOVE: ANT_AXIS, CMD_ANT_SERVO_TEST: ANT_AXIS, CMD_ANT_SERVO_HOME: ANT_AXIS,
+    CMD_SERVOS_MOVE: TX_AXIS | ANT_AXIS, CMD_SERVOS_HOME: TX_AXIS | ANT_AXIS,
+}
+
+def new_session():
+    """ A session for a sender starting up, never 0 """
+
+    return random.randint(1, 0xFFFF)
+
+def moving_axes(cmd, params):
+    """
+    Capacitors the command moves as a mask of TX_AXIS | ANT_AXIS,
+    0 if it does anything other than move them
+
+    Arguments:
+        cmd         -- command type
+        params      -- command parameters
+    """
+
+    if cmd == CMD_BATCH:
+        axes = 0
+        for entry in params[1]:
+            entry_axes = moving_axes(entry[0], entry[1])
+            if entry_axes == 0:
+                return 0
+            axes |= entry_axes
+        return axes
+    if cmd == CMD_TUNE:
+        # [pins, taps, tx, ant, mode]
+        if params[1] != TAPS_UNKNOWN:
+            return 0
+        axes = 0
+        if params[2] != MEMORY_NO_ANGLE:
+            axes |= TX_AXIS
+        if params[3] != MEMORY_NO_ANGLE:
+            axes |= ANT_AXIS
+        return axes
+    return _AXES.get(cmd, 0)
+
+#======================================================================================================================
+# Round trip time
+class RttEstimator:
+
+    def __init__(self):
+        """
+        Constructor
+
+        Arguments:
+
+        """
+
+        self.__srtt = None
+        self.__rttvar = None
+        self.__rto = INITIAL_RTO
+
+    def sample(self, rtt):
+        """
+        Add a round trip time, only for commands that were not retransmitted
+
+        Arguments:
+            rtt     -- seconds from send to ack
+        """
+
+        if self.__srtt == None:
+            self.__srtt = rtt
+            self.__rttvar = rtt / 2
+        else:
+            self.__rttvar = 0.75 * self.__rttvar + 0.25 * abs(self.__srtt - rtt)
+            self.__srtt = 0.875 * self.__srtt + 0.125 * rtt
+        self.__rto = max(MIN_RTO, min(MAX_RTO, self.__srtt + 4 * self.__rttvar))
+
+    def backoff(self):
+        """ No ack in time, double the timeout """
+
+        self.__rto = min(MAX_RTO, self.__rto * 2)
+
+    def rto(self):
+        return self.__rto
+
+    def srtt(self):
+        return self.__srtt
+
+#======================================================================================================================
+# Duplicate suppression at the server
+class SeqWindow:
+
+    def __init__(self, size = SEQ_WINDOW):
+        """
+        Constructor
+
+        Arguments:
+            size    -- number of sequence numbers to remember
+        """
+
+        self.__order = deque(maxlen = size)
+        self.__seen = set()
+        self.__session = None
+
+    def seen(self, seq, session):
+        """
+        True if seq has been seen recently, otherwise remember it
+
+        Arguments:
+            seq     -- sequence number
+            session -- sender's session, a new one forgets the old numbers
+        """
+
+        if session != self.__session:
+            # Sender restarted, its numbers start again
+            self.__session = session
+            self.__order.clear()
+            self.__seen.clear()
+        if seq in self.__seen:
+            return True
+        if len(self.__order) == self.__order.maxlen:
+            self.__seen.discard(self.__order[0])
+        self.__order.append(seq)
+        self.__seen.add(seq)
+        return False
+
+#======================================================================================================================
+# Outbound sender
+class ReliableSender(threading.Thread):
+
+    def __init__(self, transmit, size = SEND_QUEUE):
+        """
+        Constructor
+
+        Arguments:
+            transmit    -- callable(cmd, params, rid, seq) to encode and send a command
+            size        -- most commands waiting to be sent
+        """
+
+        super(ReliableSender, self).__init__()
+
+        self.__transmit = transmit
+        self.__size = size
+        self.__rtt = RttEstimator()
+        self.__seq = 0
+        # Waiting to be sent, heap of (due, order, cmd, params, rid, acked, future)
+        self.__queue = []
+        self.__order = 0
+        # Sent and waiting for an ack, seq : [cmd, params, rid, sent, deadline, retries, axes, future]
+        self.__pending = {}
+
+        self.__terminate = False
+        self.__cond = threading.Condition()
+
+    #------------------------------------------------------------------
+    # PUBLIC
+
+    def terminate(self):
+        """ Send whatever is due then stop, anything later or unacked fails """
+
+        with self.__cond:
+            self.__terminate = True
+            self.__cond.notify_all()
+
+    def send(self, cmd, params, rid = 0, delay = 0, acked = True, wait = False):
+        """
+        Queue a command, returns a Future with its SEND_* status
+
+        Arguments:
+            cmd         -- command type
+            params      -- command parameters
+            rid         -- request id
+            delay       -- seconds to hold the command before it is sent
+            acked       -- False if the server will not acknowledge it
+            wait        -- wait for room if the queue is full rather than drop it,
+                           never from a future's callback as they run on the sender thread
+
+        The status is SEND_OK when acked, or when sent if not acked,
+        SEND_SUPERSEDED if a later move made it out of date and SEND_FAILED
+        if it was never delivered.
+        """
+
+        future = Future()
+        done = []
+        with self.__cond:
+            if cmd in NO_RETRY:
+                # Latest wins, earlier moves are out of date
+                done = self.__supersede(_AXES[cmd])
+            while wait and not self.__terminate and len(self.__queue) >= self.__size:
+                self.__cond.wait()
+            if self.__terminate or len(self.__queue) >= self.__size:
+                print('Send queue full or closed, %s dropped' % cmd)
+                done.append((future, SEND_FAILED))
+            else:
+                self.__order += 1
+                heapq.heappush(self.__queue, (monotonic() + delay, self.__order, cmd, params, rid, acked and cmd not in NO_RETRY, future))
+                self.__cond.notify_all()
+        _resolve(done)
+        return future
+
+    def ack(self, seq):
+        """
+        An ack has arrived
+
+        Arguments:
+            seq     -- sequence number acked
+        """
+
+        now = monotonic()
+        with self.__cond:
+            entry = self.__pending.pop(seq, None)
+            if entry != None and entry[5] == 0:
+                # Karn, only time commands sent once
+                self.__rtt.sample(now - entry[3])
+        if entry != None:
+            _resolve([(entry[7], SEND_OK)])
+
+    def sample(self, rtt):
+        """
+        A round trip time measured some other way, e.g. by ping
+
+        Arguments:
+            rtt     -- seconds
+        """
+
+        with self.__cond:
+            self.__rtt.sample(rtt)
+
+    def rtt(self):
+        """ Smoothed round trip time in seconds or None if not known """
+
+        return self.__rtt.srtt()
+
+    def run(self):
+
+        while True:
+            sends = []
+            done = []
+            with self.__cond:
+                now = monotonic()
+                # Commands that are due, in order
+                while len(self.__queue) > 0 and self.__queue[0][0] <= now:
+                    due, order, cmd, params, rid, acked, future = heapq.heappop(self.__queue)
+                    seq = 0
+                    if acked:
+                        # 1 - 0xFFFF, 0 is no sequence number
+                        self.__seq = self.__seq % 0xFFFF + 1
+                        seq = self.__seq
+                        self.__pending[seq] = [cmd, params, rid, now, now + self.__rtt.rto(), 0, moving_axes(cmd, params), future]
+                    sends.append((cmd, params, rid, seq, future))
+                if len(sends) > 0:
+                    # Room for anyone waiting to send
+                    self.__cond.notify_all()
+                # Retries that are due
+                delay = None
+                for seq, entry in list(self.__pending.items()):
+                    if entry[4] <= now:
+                        if entry[5] >= MAX_RETRIES:
+                            print('No ack for %s, giving up' % entry[0])
+                            del self.__pending[seq]
+                            done.append((entry[7], SEND_FAILED))
+                            continue
+                        self.__rtt.backoff()
+                        entry[5] += 1
+                        entry[4] = now + self.__rtt.rto()
+                        sends.append((entry[0], entry[1], entry[2], seq, None))
+                    if delay == None or entry[4] - now < delay:
+                        delay = entry[4] - now
+                terminate = self.__terminate
+                if not terminate and len(sends) == 0 and len(done) == 0:
+                    if len(self.__queue) > 0 and (delay == None or self.__queue[0][0] - now < delay):
+                        delay = self.__queue[0][0] - now
+                    # Until the next command or timeout is due or a new command
+                    self.__cond.wait(delay)
+                    continue
+            for cmd, params, rid, seq, future in sends:
+                try:
+                    self.__transmit(cmd, params, rid, seq)
+                except OSError as e:
+                    print('Failed to send %s [%s]' % (cmd, str(e)))
+                    with self.__cond:
+                        self.__pending.pop(seq, None)
+                    done.append((future, SEND_FAILED))
+                    continue
+                if seq == 0 and future != None:
+                    done.append((future, SEND_OK))
+            if terminate:
+                with self.__cond:
+                    done += [(entry[6], SEND_FAILED) for entry in self.__queue]
+                    done += [(entry[7], SEND_FAILED) for entry in self.__pending.values()]
+                    self.__queue = []
+                    self.__pending = {}
+            _resolve(done)
+            if terminate:
+                break
+
+    #------------------------------------------------------------------
+    # PRIVATE
+
+    def __supersede(self, axes):
+        # Drop retries of anything that only moves capacitors among axes and
+        # any such queued move, returns [(future, SEND_SUPERSEDED), ...]
+        done = []
+        for seq in [seq for seq, entry in self.__pending.items() if _within(entry[6], axes)]:
+            done.append((self.__pending.pop(seq)[7], SEND_SUPERSEDED))
+        queue = []
+        for entry in self.__queue:
+            if entry[2] in NO_RETRY and _within(_AXES[entry[2]], axes):
+                done.append((entry[6], SEND_SUPERSEDED))
+            else:
+                queue.append(entry)
+        if len(queue) < len(self.__queue):
+            heapq.heapify(queue)
+            self.__queue = queue
+        return done
+
+#======================================================================================================================
+# PRIVATE
+def _within(moved, axes):
+    # True if a command moving the capacitors in moved is out of date after a move of axes
+    return moved != 0 and moved & ~axes == 0
+
+def _resolve(done):
+    # Complete futures outside the lock as callbacks run here
+    for future, status in done:
+        if future != None:
+            future.set_result(status)
@@ -28,17 +28,34 @@ CMD_TX_SERVO_SET_PWM = 'CMD_TX_SERVO_SET_PWM'
 CMD_TX_SERVO_TEST = 'CMD_TX_SERVO_TEST'
 CMD_TX_SERVO_HOME = 'CMD_TX_SERVO_HOME'
 CMD_TX_SERVO_MOVE = 'CMD_TX_SERVO_MOVE'
+CMD_TX_SERVO_STOP = 'CMD_TX_SERVO_STOP'
 CMD_ANT_SERVO_SET_PWM = 'CMD_ANT_SERVO_SET_PWM'
 CMD_ANT_SERVO_TEST = 'CMD_ANT_SERVO_TEST'
 CMD_ANT_SERVO_HOME = 'CMD_ANT_SERVO_HOME'
 CMD_ANT_SERVO_MOVE = 'CMD_ANT_SERVO_MOVE'
+CMD_ANT_SERVO_STOP = 'CMD_ANT_SERVO_STOP'
+# External commands for both servos together
+CMD_SERVOS_MOVE = 'CMD_SERVOS_MOVE'
+CMD_SERVOS_HOME = 'CMD_SERVOS_HOME'
 # External servo general settings
 CMD_SERVO_SETTINGS = 'CMD_SERVO_SETTINGS'
+# Position reports per second while moving, [rate]
+CMD_PROGRESS_RATE = 'CMD_PROGRESS_RATE'
+# Event subscription, [mask, port] and [port]
+CMD_SUBSCRIBE = 'CMD_SUBSCRIBE'
+CMD_UNSUBSCRIBE = 'CMD_UNSUBSCRIBE'
+# Step timing counters for both servos, [clear]
+CMD_SERVO_STATS = 'CMD_SERVO_STATS'
+# Positions and relay state, answered with EVNT_STATE
+CMD_GET_STATE = 'CMD_GET_STATE'
+# Latency probe answered with EVNT_PONG, [client time us]
+CMD_PING = 'CMD_PING'
 
 # Internal servo commands
 CMD_SERVO_TEST = 'CMD_SERVO_TEST'
 CMD_SERVO_HOME = 'CMD_SERVO_HOME'
 CMD_SERVO_MOVE = 'CMD_SERVO_MOVE'
+CMD_SERVO_STOP = 'CMD_SERVO_STOP'
 
 # External relay commands
 CMD_RELAYS_INIT = 'CMD_RELAYS_INIT'
@@ -46,5 +63,78 @@ CMD_RELAYS_SET = 'CMD_RELAYS_SET'
 CMD_RELAYS_RESET = 'CMD_RELAYS_RESET'
 CMD_RELAYS_CYCLE = 'CMD_RELAYS_CYCLE'
 
+# Memories held by the server
+# Upload, [pins, count] then [id, name, freq, taps, tx, ant] for each
+CMD_MEMORIES_INIT = 'CMD_MEMORIES_INIT'
+CMD_MEMORY_STORE = 'CMD_MEMORY_STORE'
+# Set the tuner to a stored memory, [id]
+CMD_RECALL_MEMORY = 'CMD_RECALL_MEMORY'
+# Angle for a capacitor to stay where it is
+MEMORY_NO_ANGLE = 0xFF
+
+# Relays and both capacitors as one transaction with one EVNT_DONE
+# [pins, taps, tx, ant, mode], TAPS_UNKNOWN leaves the relays
+CMD_TUNE = 'CMD_TUNE'
+# Relay timing for CMD_TUNE and CMD_RECALL_MEMORY, [break ms, settle ms, overlap]
+CMD_TUNE_SETTINGS = 'CMD_TUNE_SETTINGS'
+
+# Batch of the above executed as one unit
+CMD_BATCH = 'CMD_BATCH'
+
 CMD_RESET = 'CMD_RESET'
 
+# Move profiles, sent with CMD_TX_SERVO_MOVE/CMD_ANT_SERVO_MOVE
+MOVE_TRACK = 0      # Tracking the slider, small frequent moves
+MOVE_SCAN = 1       # Single larger moves e.g. memory recall
+
+# Motion defaults until CMD_SERVO_SETTINGS arrives
+DEFAULT_TRACK_INC = 1
+DEFAULT_TRACK_DELAY = 20    # ms
+DEFAULT_SCAN_INC = 1
+DEFAULT_SCAN_DELAY = 20     # ms
+# Largest step as a multiple of the inc
+TRACK_MAX_MULT = 4
+SCAN_MAX_MULT = 10
+
+# Events
+HEARTBEAT_PERIOD = 0.5    # s
+PROGRESS_RATE = 10        # Hz
+EVNT_HEARTBEAT = 'heartbeat'
+EVNT_TX = 'tx'
+EVNT_ANT = 'ant'
+EVNT_BATCH = 'batch'
+EVNT_STATS = 'stats'
+EVNT_POS = 'pos'
+EVNT_DONE = 'done'
+EVNT_ACK = 'ack'
+EVNT_PONG = 'pong'
+EVNT_STATE = 'state'
+
+# Inductor taps are a bitmask, bit n for pin n of the pins sent, see bands.py
+# Relays left alone, or in EVNT_STATE not known
+TAPS_UNKNOWN = 0xFFFF
+
+# EVNT_DONE status
+DONE_OK = 0
+DONE_REJECTED = 1
+DONE_SUPERSEDED = 2     # A later tune took over
+
+# Subscription mask bits
+SUB_HEARTBEAT = 0x01
+SUB_PROGRESS = 0x02     # EVNT_POS or EVNT_TX/EVNT_ANT
+SUB_ALL = 0xFF
+SUBSCRIBE_TIMEOUT = 30  # s
+IMPLICIT_TIMEOUT = 300  # s without a request from the host
+MAX_SUBSCRIBERS = 16
+
+# Server side memory store
+MEMORY_STORE_PATH = '../config/tuner_memories.pkl'
+MAX_MEMORIES = 4096
+
+# Positions and relays kept across restarts
+STATE_PATH = '../config/tuner_state.pkl'
+STATE_SAVE_DELAY = 2.0  # s changes are gathered before writing them
+
+# Tune transaction defaults until CMD_TUNE_SETTINGS arrives
+TUNE_BREAK = 20     # ms from relays off to relays on
+TUNE_SETTLE = 50    # ms for the contacts to settle
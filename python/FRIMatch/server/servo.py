@@ -27,7 +27,7 @@
  There is one variable capacitor for the L-Match controlled by a servo.
  
     Servo motor:   Any 180 degree capable, model control servos.
-    Controller:     Adafruit 16-Channel 12-bit PWM/Servo Driver - I2C interface - PCA9685
+    Controller:     Adafruit 16-Channel 12-bit PWM/Servo Driver - I2C interface - PCA9685, see pwm.py
  
  Note, you can't slow down a servo, they will go full pelt so the strategy is to move
  incrementally with a delay. With small increments this can appear smooth.
@@ -37,40 +37,40 @@
 # System imports
 import threading
 from collections import deque
-from time import sleep
+from time import monotonic
 
 # Application imports
 from server_defs import *
+import motion
+import pwm
 
-# Import the Adafruit libs
-servo_test_mode = False
-try:
-    from adafruit_servokit import ServoKit
-except ModuleNotFoundError:
-    print("Servo - not running on RPi, using test mode!")
-    servo_test_mode = True
+servo_test_mode = pwm.pwm_test_mode
 
 """
-Device class implements low level servo interface
+ServoChannel holds the state of one servo and performs its motion.
+It does no waiting itself. The MotionScheduler below calls service()
+whenever a command is posted or the delay it last returned has expired.
+Motion is taken one step per call so a new move retargets the servo from
+wherever it is and a stop halts it. A move that reverses the servo first
+brakes to rest along the profile and then starts the new move.
 """
-class Servo(threading.Thread):
+class ServoChannel:
     
-    def __init__(self, id, callback):
+    def __init__(self, id, driver):
         """
         Constructor
         
         Arguments:
-            callback    -- callback here with progress
+            id          -- servo channel on the controller
+            driver      -- the shared pwm.PWMDriver
             
         """
         
-        super(Servo, self).__init__()
-        
         self.__id = id
-        self.__callback = callback
+        self.__driver = driver
         
-        # Flags
-        self.__terminate = False
+        # Called when a command is posted, set by the driver
+        self.__wakeup = None
         
         # Queue to post on
         self.__q = deque()
@@ -78,62 +78,164 @@ class Servo(threading.Thread):
         # Set the default range
         self.__servo_min = 600
         self.__servo_max = 2000
+        self.__driver.set_range(self.__id, self.__servo_min, self.__servo_max)
         self.__last_angle = 0
+        # Where the servo was last told to go
+        self.__commanded = 0
+        
+        # Motion profiles
+        self.__profiles = {}
+        self.settings(DEFAULT_TRACK_INC, DEFAULT_TRACK_DELAY, DEFAULT_SCAN_INC, DEFAULT_SCAN_DELAY)
+        
+        # Motion in progress
+        #   target  -- angle being moved to or None when idle
+        #   profile -- profile for the move
+        #   step    -- size of the last step, 0 at rest
+        #   plan    -- further (target, profile, pause before) to run after target
+        #   due     -- monotonic time the next step is due
+        self.__target = None
+        self.__profile = None
+        self.__step = 0
+        self.__plan = deque()
+        self.__due = 0.0
         
-        # Best for servos
-        if not servo_test_mode:
-            self.__kit = ServoKit(channels=16)
+        # Step timing
+        self.__stats = motion.StepStats()
     
     #------------------------------------------------------------------
     # PUBLIC
     
-    def terminate(self):
+    def set_wakeup(self, wakeup):
+        self.__wakeup = wakeup
         
-        self.__terminate = True
-        self.__dev = None
-    
     def settings(self, track_inc, track_delay, scan_inc, scan_delay):
         
         self.__track_inc = int(track_inc)
         self.__track_delay = int(track_delay)
         self.__scan_inc = int(scan_inc)
         self.__scan_delay = int(scan_delay)
-        
+        self.__profiles[MOVE_TRACK] = motion.Profile(self.__track_inc, self.__track_delay, TRACK_MAX_MULT)
+        self.__profiles[MOVE_SCAN] = motion.Profile(self.__scan_inc, self.__scan_delay, SCAN_MAX_MULT)
         
     def set_pwm_range(self, low, high):
         self.__servo_min = low
         self.__servo_max = high
         if servo_test_mode:
             print ("Setting min,max to: %d, %d" % (low,high))
-        else:
-            # Create instance
-            self.__kit.servo[self.__id].set_pulse_width_range(low,high)
+        self.__driver.set_range(self.__id, low, high)
     
     def test_range(self):
-        self.__q.append((CMD_SERVO_TEST, ()))
+        self.post((CMD_SERVO_TEST, ()))
+    
+    def angle(self):
+        """ Current position in degrees """
+        
+        return self.__last_angle
+    
+    def commanded(self):
+        """ Position last commanded in degrees """
+        
+        return self.__commanded
+    
+    def restore(self, angle):
+        """
+        Take up a known position at start up, call before the driver runs.
+        A servo that is already there does not move.
+        
+        Arguments:
+            angle   --  degrees (0 - 180)
+        
+        """
+        
+        self.__driver.set_angle(self.__id, angle)
+        self.__last_angle = angle
+        self.__commanded = angle
+        
+    def move_time(self, angle, mode):
+        """
+        Ticks and tick period a move from rest to angle would take
+        
+        Arguments:
+            angle   --  degrees to move to (0 - 180)
+            mode    --  MOVE_TRACK | MOVE_SCAN
+        
+        """
+        
+        profile = self.__profile_for(mode)
+        return profile.ticks(abs(int(angle) - self.__last_angle)), profile.period()
+    
+    def stats(self, clear = False):
+        """
+        Step timing counters, see motion.StepStats.snapshot()
+        
+        Arguments:
+            clear   --  zero the counters after reading
+        
+        """
+        
+        snapshot = self.__stats.snapshot()
+        if clear:
+            self.__stats.clear()
+        return snapshot
         
     def post(self, cmd):
         self.__q.append(cmd)
+        if self.__wakeup != None:
+            self.__wakeup()
+    
+    def service(self, now):
+        """
+        Act on posted commands and take the next step if it is due
+        
+        Arguments:
+            now     --  monotonic time
+        
+        Returns seconds until service is next needed or None when idle
+        
+        """
+        
+        home, angle, test, stop = self.__rationalise()
+        if stop:
+            if self.__target != None and servo_test_mode:
+                print('Servo stop at %d' % self.__last_angle)
+            self.__commanded = self.__last_angle
+            self.__target = None
+            self.__plan.clear()
+            self.__stats.end()
+        if home != None:
+            self.__home()
+        if angle != None:
+            # Retarget from wherever we are now
+            self.__plan.clear()
+            profile = self.__profile_for(angle[1])
+            if len(angle) > 2:
+                # Paced to finish with another servo
+                profile = profile.stretched(angle[2])
+            self.__start(angle[0], profile, now)
+            self.__commanded = angle[0]
+        if test != None:
+            self.__plan.clear()
+            self.__start(0, self.__profile_for(MOVE_SCAN), now)
+            self.__plan.append((180, self.__profile_for(MOVE_SCAN), 2.0))
+            self.__commanded = 180
+        
+        if self.__target == None:
+            return None
+        if now < self.__due:
+            return self.__due - now
+        self.__step_to(now)
+        if self.__target == None:
+            return None
+        return max(0.0, self.__due - now)
         
     #------------------------------------------------------------------
     # PRIVATE
     
-    def run(self):
-        
-        while not self.__terminate:
-            home, angle, test = self.__rationalise()
-            if home != None:
-               self.__home()
-            if angle != None:
-                self.__move(angle)
-            if test != None:
-                self.__test()
-            sleep(0.1)
-    
     def __rationalise(self):
         """
         Rationalise the commands to HOME and MOVE
-        such that we pick up one home if present and the last move
+        such that we pick up one home if present and the last move.
+        A STOP discards any move or test posted before it.
         
         Arguments:
         
@@ -141,6 +243,7 @@ class Servo(threading.Thread):
         home = None
         angle = None
         test = None
+        stop = False
         
         while len(self.__q) > 0:
             cmd, params = self.__q.popleft()
@@ -148,10 +251,20 @@ class Servo(threading.Thread):
                 home = params
             elif cmd == CMD_SERVO_MOVE:
                 angle = params
+                test = None
             elif cmd == CMD_SERVO_TEST:
                 test = params
-        return home, angle, test
+                angle = None
+            elif cmd == CMD_SERVO_STOP:
+                angle = None
+                test = None
+                stop = True
+        return home, angle, test, stop
                
+    def __profile_for(self, mode):
+        
+        return self.__profiles.get(mode, self.__profiles[MOVE_TRACK])
+    
     def __home(self):
         """
         Move servos to the home position.
@@ -160,40 +273,326 @@ class Servo(threading.Thread):
         
         """
         
-        # Send home
+        # Send home, this abandons any move
+        self.__target = None
+        self.__plan.clear()
+        self.__stats.end()
         if servo_test_mode:
             print("Servo home")
-        else:
-            self.__kit.servo[self.__id].angle = 0
-            self.__last_angle = 0
-        self.__callback(0)
-        
-    def __move(self, angle):
+        self.__driver.set_angle(self.__id, 0)
+        self.__last_angle = 0
+        self.__commanded = 0
+    
+    def __start(self, angle, profile, now):
         """
-        Move servo to the given position.
+        Start or retarget a move to the given position.
         
         Arguments:
         angle   --  degrees to move to (0 - 180)
+        profile --  motion.Profile for the move
+        now     --  monotonic time
 
         """
         
+        if self.__target != None and (angle - self.__last_angle) * (self.__target - self.__last_angle) <= 0:
+            # Reversing, brake to rest on the way we are going then set off back
+            stopping = self.__profile.stopping(self.__step)
+            if stopping > 0:
+                if self.__target > self.__last_angle:
+                    rest = min(180, self.__last_angle + stopping)
+                else:
+                    rest = max(0, self.__last_angle - stopping)
+                self.__target = rest
+                self.__plan.appendleft((angle, profile, self.__profile.period()))
+                return
+            # Already at the minimum step so reverse from rest
+            self.__step = 0
         if servo_test_mode:
             print('Servo move to %d' % angle)
-        if angle > self.__last_angle:
-            step = 1
+        if self.__target == None:
+            # From rest, first step now then on the profile period
+            self.__step = 0
+            self.__due = now
+            self.__stats.begin()
+        self.__target = angle
+        self.__profile = profile
+        
+    def __step_to(self, now):
+        """
+        Move one step towards the target.
+        
+        Arguments:
+        now     --  monotonic time
+
+        """
+        
+        # Take the step against its deadline
+        late = now - self.__due
+        period = self.__profile.period()
+        self.__due += period
+        overrun = self.__due <= now
+        if overrun:
+            # Missed a whole period, don't burst to catch up
+            self.__due = now + period
+        self.__stats.step(late, overrun)
+        
+        remaining = abs(self.__target - self.__last_angle)
+        if remaining > 0:
+            self.__step = self.__profile.next_step(remaining, self.__step)
+        if self.__target > self.__last_angle:
+            next_angle = self.__last_angle + self.__step
+        elif self.__target < self.__last_angle:
+            next_angle = self.__last_angle - self.__step
         else:
-            step = -1
-        for next_angle in range(self.__last_angle, angle, step):
-            if not servo_test_mode:  
-                self.__kit.servo[self.__id].angle = next_angle
-            self.__last_angle = next_angle
-            self.__callback(next_angle)
-            sleep(0.02)
-        self.__last_angle = angle
-        self.__callback(angle)
+            next_angle = self.__target
+        self.__driver.set_angle(self.__id, next_angle)
+        self.__last_angle = next_angle
+        
+        if next_angle == self.__target:
+            # Arrived, continue with the plan if any
+            self.__target = None
+            self.__step = 0
+            self.__stats.end()
+            if len(self.__plan) > 0:
+                angle, profile, pause = self.__plan.popleft()
+                self.__start(angle, profile, now + pause)
+
+"""
+MotionScheduler owns all the servo channels and services them on one
+timeline so a single driver, either the Motion thread below or an asyncio
+task (see aio.py), runs every servo. Joint moves are paced so that all
+servos arrive together, taking the time of the longest move.
+Positions are reported together, no faster than the progress rate while
+moving and always once the servos have settled.
+"""
+class MotionScheduler:
+    
+    def __init__(self, channels, driver, callback):
+        """
+        Constructor
+        
+        Arguments:
+            channels    -- the ServoChannels to run
+            driver      -- the pwm.PWMDriver they share
+            callback    -- callback here with a tuple of channel positions and True if settled
+            
+        """
+        
+        self.__channels = channels
+        self.__driver = driver
+        self.__callback = callback
+        
+        # Progress reporting
+        self.__interval = 0.0
+        self.set_rate(PROGRESS_RATE)
+        self.__reported = None
+        self.__next_report = 0.0
+        self.__moving = False
+        
+        # Called when all servos are at rest, posted from other threads
+        self.__settled = []
+        self.__lock = threading.Lock()
+        
+        # Called when a command is posted to any channel, set by the driver
+        self.__wakeup = None
+        for channel in self.__channels:
+            channel.set_wakeup(self.__posted)
+    
+    #------------------------------------------------------------------
+    # PUBLIC
+    
+    def set_wakeup(self, wakeup):
+        self.__wakeup = wakeup
+    
+    def set_rate(self, rate):
+        """
+        Set the progress rate
+        
+        Arguments:
+            rate    --  reports per second while moving, 0 for settled positions only
+        
+        """
+        
+        if rate > 0:
+            self.__interval = 1.0 / rate
+        else:
+            self.__interval = None
+    
+    def move(self, angles, mode):
+        """
+        Move all channels so they arrive at the same time
+        
+        Arguments:
+            angles  --  degrees to move to (0 - 180) per channel, None to leave a channel
+            mode    --  MOVE_TRACK | MOVE_SCAN
+        
+        """
+        
+        moves = [(channel, angle) for channel, angle in zip(self.__channels, angles) if angle != None]
+        if len(moves) == 0:
+            return
+        # Timed as though from rest, close enough when retargeting.
+        # The first step is immediate so a move lasts ticks - 1 periods.
+        times = [channel.move_time(angle, mode) for channel, angle in moves]
+        duration = max([(ticks - 1) * period for ticks, period in times])
+        for (channel, angle), (ticks, period) in zip(moves, times):
+            if ticks > 1 and (ticks - 1) * period < duration:
+                channel.post((CMD_SERVO_MOVE, (angle, mode, duration / (ticks - 1))))
+            else:
+                channel.post((CMD_SERVO_MOVE, (angle, mode)))
+    
+    def home(self):
+        """ Home all channels together """
+        
+        for channel in self.__channels:
+            channel.post((CMD_SERVO_HOME, ()))
+    
+    def positions(self):
+        """ Tuple of channel positions """
+        
+        return tuple([channel.angle() for channel in self.__channels])
+    
+    def commanded(self):
+        """ Tuple of positions last commanded """
+        
+        return tuple([channel.commanded() for channel in self.__channels])
+    
+    def restore(self, positions):
+        """
+        Take up known positions at start up, call before the driver runs
+        
+        Arguments:
+            positions   --  degrees per channel
+        
+        """
+        
+        for channel, angle in zip(self.__channels, positions):
+            channel.restore(angle)
+        self.__driver.flush()
+        self.__reported = self.positions()
+    
+    def when_settled(self, callback):
+        """
+        Call back once all servos are at rest, including commands already posted
+        
+        Arguments:
+            callback    --  callable(positions, now)
+        
+        """
+        
+        with self.__lock:
+            self.__settled.append(callback)
+        self.__posted()
+    
+    def service(self, now):
+        """
+        Service every channel
+        
+        Arguments:
+            now     --  monotonic time
+        
+        Returns seconds until service is next needed or None when idle
+        
+        """
+        
+        # Only callbacks already waiting, one added while the channels are
+        # serviced may be for a move posted after its channel was looked at
+        # and waits for the next pass, which its wakeup brings
+        with self.__lock:
+            settled = self.__settled
+            self.__settled = []
+        delay = None
+        for channel in self.__channels:
+            d = channel.service(now)
+            if d != None and (delay == None or d < delay):
+                delay = d
+        # All of this tick's steps in one write
+        self.__driver.flush()
+        self.__report(now, delay == None)
+        if delay == None:
+            for callback in settled:
+                callback(self.positions(), now)
+        elif len(settled) > 0:
+            with self.__lock:
+                self.__settled = settled + self.__settled
+        return delay
+    
+    #------------------------------------------------------------------
+    # PRIVATE
+    
+    def __report(self, now, settled):
+        
+        positions = self.positions()
+        if settled:
+            # Always report coming to rest
+            moved = self.__moving
+            self.__moving = False
+            if positions == self.__reported and not moved:
+                return
+        else:
+            self.__moving = True
+            if positions == self.__reported:
+                return
+            if self.__interval == None or now < self.__next_report:
+                return
+        self.__reported = positions
+        if self.__interval != None:
+            self.__next_report = now + self.__interval
+        self.__callback(positions, settled)
+    
+    def __posted(self):
+        
+        if self.__wakeup != None:
+            self.__wakeup()
 
+"""
+Thread driver for the MotionScheduler
+The thread sleeps on a condition until a command is posted or a step is due.
+"""
+class Motion(threading.Thread):
     
-    def __test(self):
-        self.__move(0)
-        sleep(2)
-        self.__move(180)
\ No newline at end of file
+    def __init__(self, scheduler):
+        """
+        Constructor
+        
+        Arguments:
+            scheduler   -- the MotionScheduler to drive
+            
+        """
+        
+        super(Motion, self).__init__()
+        
+        self.__scheduler = scheduler
+        
+        # Flags, service once at the start for anything posted before we ran
+        self.__terminate = False
+        self.__posted = True
+        
+        # Wait here for commands
+        self.__cond = threading.Condition()
+        self.__scheduler.set_wakeup(self.__wakeup)
+    
+    def terminate(self):
+        
+        with self.__cond:
+            self.__terminate = True
+            self.__cond.notify()
+    
+    def run(self):
+        
+        delay = None
+        while True:
+            with self.__cond:
+                if not self.__posted and not self.__terminate:
+                    # Until the next step is due or a command is posted
+                    self.__cond.wait(delay)
+                if self.__terminate:
+                    break
+                self.__posted = False
+            delay = self.__scheduler.service(monotonic())
+    
+    def __wakeup(self):
+        
+        with self.__cond:
+            self.__posted = True
+            self.__cond.notify()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+#
+# state.py
+#
+# Copyright (C) 2021 by G3UKB Bob Cowdery
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#  The author can be reached by email at:
+#     bob@bobcowdery.plus.com
+#
+
+"""
+----------------------------------------------------------------------
+ Tuner state kept across restarts.
+
+ The positions the servos settled at, the positions last commanded, the
+ servo pulse ranges and the relay state are saved whenever they change,
+ for positions once the servos settle. At start up the server puts the
+ hardware back as it was rather than homing, and CMD_GET_STATE lets a
+ client that reconnects set its controls to match without moving
+ anything.
+
+ Changes are gathered for STATE_SAVE_DELAY and written on a timer thread,
+ so a settle never waits on the file system and dragging a slider writes
+ the file once rather than at every stop. close() writes anything still
+ waiting.
+----------------------------------------------------------------------
+"""
+
+# System imports
+import os
+import pickle
+import threading
+
+# Application imports
+from server_defs import *
+
+class TunerState:
+
+    def __init__(self, path = STATE_PATH):
+        """
+        Constructor
+
+        Arguments:
+            path    -- file to keep the state in
+
+        """
+
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__saver = DeferredSave(path, self.__copy)
+        # False until there is saved state
+        self.__known = False
+        self.__state = {
+            'settled': (0, 0),
+            'commanded': (0, 0),
+            'ranges': [None, None],
+            'taps': TAPS_UNKNOWN,
+            'pins': [],
+        }
+        saved = load(self.__path)
+        if saved != None:
+            self.__state.update(saved)
+            self.__known = True
+
+    #------------------------------------------------------------------
+    # PUBLIC
+
+    def known(self):
+        """ True if there was saved state at start up """
+
+        return self.__known
+
+    def settled(self, positions, commanded):
+        """
+        The servos are at rest
+
+        Arguments:
+            positions   -- (tx, ant) where they are
+            commanded   -- (tx, ant) where they were last told to go
+
+        """
+
+        self.__update(settled = tuple(positions), commanded = tuple(commanded))
+
+    def pwm_range(self, channel, low, high):
+        """
+        A servo pulse range has been set
+
+        Arguments:
+            channel     -- 0 tx, 1 ant
+            low         -- pulse width in us at 0 degrees
+            high        -- pulse width in us at 180 degrees
+
+        """
+
+        with self.__lock:
+            ranges = list(self.__state['ranges'])
+        ranges[channel] = (low, high)
+        self.__update(ranges = ranges)
+
+    def relays(self, taps, pins):
+        """
+        The relays have changed
+
+        Arguments:
+            taps        -- taps energised as a bitmask over the pins or TAPS_UNKNOWN
+            pins        -- the inductor pin map, [(pin, invert), ...]
+
+        """
+
+        self.__update(taps = taps, pins = [tuple(pin) for pin in pins])
+
+    def close(self):
+        """ Write any change still waiting, at shut down """
+
+        self.__saver.close()
+
+    def snapshot(self):
+        """ (settled positions, commanded positions, pulse ranges, taps, pins) """
+
+        with self.__lock:
+            s = self.__state
+            return s['settled'], s['commanded'], list(s['ranges']), s['taps'], list(s['pins'])
+
+    #------------------------------------------------------------------
+    # PRIVATE
+
+    def __update(self, **changes):
+
+        with self.__lock:
+            if all([self.__state[key] == value for key, value in changes.items()]):
+                # Nothing to write
+                return
+            self.__state.update(changes)
+            self.__known = True
+        self.__saver.changed()
+
+    def __copy(self):
+
+        with self.__lock:
+            return dict(self.__state)
+
+#======================================================================================================================
+# Writes gathered on a timer thread
+class DeferredSave:
+
+    def __init__(self, path, snapshot, delay = STATE_SAVE_DELAY):
+        """
+        Constructor
+
+        Arguments:
+            path        -- file to save to
+            snapshot    -- callable returning what to save, called when writing
+            delay       -- seconds from the first change to the write
+
+        """
+
+        self.__path = path
+        self.__snapshot = snapshot
+        self.__delay = delay
+        # Pending write or None
+        self.__timer = None
+        self.__lock = threading.Lock()
+        # One write at a time
+        self.__write_lock = threading.Lock()
+
+    def changed(self):
+        """ Something changed, write it after the delay """
+
+        with self.__lock:
+            if self.__timer == None:
+                # Later changes go in the same write
+                self.__timer = threading.Timer(self.__delay, self.__write)
+                self.__timer.daemon = True
+                self.__timer.start()
+
+    def close(self):
+        """ Write any change still waiting, at shut down """
+
+        with self.__lock:
+            timer = self.__timer
+        if timer != None:
+            timer.cancel()
+            self.__write()
+
+    def __write(self):
+
+        with self.__write_lock:
+            with self.__lock:
+                self.__timer = None
+            save(self.__path, self.__snapshot())
+
+#======================================================================================================================
+# Pickle files on the Pi
+def load(path):
+    """
+    Load a pickled file, None if missing or unreadable
+
+    Arguments:
+        path    -- file to load
+
+    """
+
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        print('Failed to load %s [%s]' % (path, str(e)))
+        return None
+
+def save(path, data):
+    """
+    Save to a pickled file, never leaving it half written
+
+    Arguments:
+        path    -- file to save to
+        data    -- what to save
+
+    """
+
+    try:
+        dir, file = os.path.split(path)
+        if len(dir) > 0 and not os.path.exists(dir):
+            os.mkdir(dir)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(data, f)
+        os.replace(tmp, path)
+    except Exception as e:
+        print('Failed to save %s [%s]' % (path, str(e)))
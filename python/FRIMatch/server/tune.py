@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+#
+# tune.py
+#
+# Copyright (C) 2021 by G3UKB Bob Cowdery
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#  The author can be reached by email at:
+#     bob@bobcowdery.plus.com
+#
+
+"""
+----------------------------------------------------------------------
+ Tune transactions.
+
+ A tune sets the inductor relays and moves both capacitors as one unit
+ with one completion. When the relays change they break before they
+ make: relays that go off do so first, the new ones are energised after
+ the break time and the contacts are then given the settle time. The
+ capacitors start moving at once alongside the relays unless overlap is
+ off, in which case they wait for the relays to settle. A relay that
+ needs no change costs no time. The transaction completes when the
+ relays have settled and the servos are at rest.
+
+ Only one transaction runs at a time, a new one supersedes it. A
+ superseded transaction's relay steps run to the end so the relays are
+ never left half changed, but it moves nothing more and never completes.
+----------------------------------------------------------------------
+"""
+
+# System imports
+import threading
+from time import monotonic
+
+# Application imports
+from server_defs import *
+
+class TuneExecutor:
+
+    def __init__(self, relays, scheduler, sequencer):
+        """
+        Constructor
+
+        Arguments:
+            relays      -- the relays.Relays
+            scheduler   -- the servo MotionScheduler
+            sequencer   -- relays.Sequencer to time the relay steps
+
+        """
+
+        self.__relays = relays
+        self.__scheduler = scheduler
+        self.__sequencer = sequencer
+
+        self.__break = TUNE_BREAK / 1000.0
+        self.__settle = TUNE_SETTLE / 1000.0
+        self.__overlap = True
+
+        # Transaction in progress or None
+        self.__current = None
+        self.__lock = threading.Lock()
+
+    #------------------------------------------------------------------
+    # PUBLIC
+
+    def set_relays(self, relays):
+        self.__relays = relays
+
+    def settings(self, break_ms, settle_ms, overlap):
+        """
+        Set the relay timing
+
+        Arguments:
+            break_ms    -- ms from relays going off to the new ones going on
+            settle_ms   -- ms for the contacts to settle after a change
+            overlap     -- move the capacitors while the relays change
+
+        """
+
+        self.__break = break_ms / 1000.0
+        self.__settle = settle_ms / 1000.0
+        self.__overlap = bool(overlap)
+
+    def tune(self, pins, angles, mode = MOVE_SCAN):
+        """
+        Start a transaction
+
+        Arguments:
+            pins        -- relays to have energised, [(pin, invert), ...] or None to leave them
+            angles      -- (tx, ant) degrees, None for a capacitor to stay where it is
+            mode        -- MOVE_TRACK | MOVE_SCAN
+
+        """
+
+        transaction = _Transaction(monotonic())
+        with self.__lock:
+            previous = self.__current
+            self.__current = transaction
+        if previous != None:
+            previous.finish(DONE_SUPERSEDED, self.__scheduler.positions(), monotonic())
+
+        steps = []
+        if pins != None:
+            # Plan from where any relay test has got to
+            self.__sequencer.cancel()
+            breaking, making = self.__relays.plan(pins)
+            if breaking:
+                steps.append((0, lambda: self.__relays.break_pins(pins)))
+            if making:
+                if breaking:
+                    delay = self.__break
+                else:
+                    delay = 0
+                steps.append((delay, lambda: self.__relays.make_pins(pins)))
+        move = lambda: self.__move(transaction, angles, mode)
+        if len(steps) > 0:
+            steps.append((self.__settle, lambda: self.__relays_settled(transaction, move)))
+            if self.__overlap:
+                move()
+            self.__sequencer.run(steps)
+        else:
+            # Relays are already right
+            transaction.relays_done = True
+            move()
+
+    def supersede(self):
+        """ Another command has taken over the relays, end the transaction in progress """
+
+        with self.__lock:
+            transaction = self.__current
+            self.__current = None
+        if transaction != None:
+            transaction.finish(DONE_SUPERSEDED, self.__scheduler.positions(), monotonic())
+
+    def when_done(self, callback):
+        """
+        Call back when the transaction in progress completes, at once if none
+
+        Arguments:
+            callback    -- callable(status, positions, now)
+
+        """
+
+        with self.__lock:
+            transaction = self.__current
+        if transaction == None or not transaction.add(callback):
+            callback(DONE_OK, self.__scheduler.positions(), monotonic())
+
+    #------------------------------------------------------------------
+    # PRIVATE
+
+    def __relays_settled(self, transaction, move):
+
+        with self.__lock:
+            if self.__current != transaction:
+                # Superseded while the relays changed, leave the servos alone
+                return
+        if not self.__overlap:
+            move()
+        transaction.relays_done = True
+        self.__check(transaction)
+
+    def __move(self, transaction, angles, mode):
+
+        self.__scheduler.move(angles, mode)
+        def settled(positions, now):
+            transaction.motion_done = True
+            self.__check(transaction)
+        self.__scheduler.when_settled(settled)
+
+    def __check(self, transaction):
+
+        with self.__lock:
+            if not (transaction.relays_done and transaction.motion_done):
+                return
+            if self.__current != transaction:
+                # Already finished as superseded
+                return
+            self.__current = None
+        transaction.finish(DONE_OK, self.__scheduler.positions(), monotonic())
+
+class _Transaction:
+
+    def __init__(self, start):
+
+        self.start = start
+        self.relays_done = False
+        self.motion_done = False
+        self.__finished = False
+        self.__callbacks = []
+        self.__lock = threading.Lock()
+
+    def add(self, callback):
+        # False if already finished
+
+        with self.__lock:
+            if self.__finished:
+                return False
+            self.__callbacks.append(callback)
+            return True
+
+    def finish(self, status, positions, now):
+
+        with self.__lock:
+            if self.__finished:
+                return
+            self.__finished = True
+            callbacks = self.__callbacks
+            self.__callbacks = []
+        for callback in callbacks:
+            callback(status, positions, now)